@@ -0,0 +1,141 @@
+"""
+Times each stage of a run against recorded warrennolan.com pages and prints
+the timings as JSON.
+
+    python benchmark.py --record    # fetch the season once and save it to --fixtures
+    python benchmark.py             # replay --fixtures without network access
+    python benchmark.py --output benchmarks.jsonl    # also append the result to a history file
+
+Stages: fetch (every page through the replay transport), parse (NET nitty
+page and team sheets), build (team records), sort (sort_teams with each
+scoring engine) and output (generate_output_file in each format, in memory).
+"""
+import argparse
+import contextlib
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+import yaml
+
+import main
+
+
+def load_config(config_file):
+    with open(config_file, 'r') as f:
+        text = f.read()
+    return yaml.safe_load(text.replace("\u00a0", " ").replace("\ufeff", "").replace("Â", ""))
+
+
+def timed(func, repeat):
+    """Runs func repeat times. Returns its last result and the run times in seconds."""
+    seconds = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        seconds.append(time.perf_counter() - start)
+    return result, seconds
+
+
+def summary(seconds):
+    return {
+        'min': round(min(seconds), 6),
+        'median': round(statistics.median(seconds), 6),
+        'runs': [round(run, 6) for run in seconds]
+    }
+
+
+def record(fixture_dir, config):
+    """Fetches the NET nitty page and every eligible team sheet into fixture_dir."""
+    main.configure_http_session(config.get('HTTP', {}) or {})
+    main.configure_fixtures({'MODE': 'record', 'DIRECTORY': fixture_dir})
+    net_nitty_rows = main.get_net_nitty_raw_data()
+    team_dict_list = []
+    main.scrape_team_stats(net_nitty_rows, set(), set(), False, set(), team_dict_list,
+                           int(config.get('SCRAPE_WORKERS', 1) or 1))
+    return len(team_dict_list)
+
+
+def run_benchmark(fixture_dir, config, repeat):
+    main.configure_http_session(config.get('HTTP', {}) or {})
+    main.configure_response_cache({})
+    main.configure_snapshot_store({})
+    main.configure_fixtures({'MODE': 'replay', 'DIRECTORY': fixture_dir})
+    formula = config.get('JORDAN_FORMULA', {}) or {}
+    visible_columns = config.get('VISIBLE_COLUMNS', []) or []
+    at_large_teams = set(config.get('AT_LARGE', []) or [])
+
+    net_nitty_rows = main.parse_net_nitty_page(main.http_get(main.MEN_URL).content)
+    rows = [row for row in net_nitty_rows if not row.ineligible]
+    team_urls = [main.get_team_url(row.team) for row in rows]
+    stages = {}
+
+    def fetch():
+        net_nitty_page = main.http_get(main.MEN_URL).content
+        return net_nitty_page, [main.http_get(team_url).content for team_slug, team_url in team_urls]
+
+    (net_nitty_page, team_pages), stages['fetch'] = timed(fetch, repeat)
+
+    def parse():
+        main.parse_net_nitty_page(net_nitty_page)
+        return [main.parse_team_sheet(content, team_slug, team_url)
+                for content, (team_slug, team_url) in zip(team_pages, team_urls)]
+
+    team_sheets, stages['parse'] = timed(parse, repeat)
+
+    def build():
+        return [main.build_team_data_obj(row, main.team_stats_from_sheet(team_sheet, at_large_teams))
+                for row, team_sheet in zip(rows, team_sheets)]
+
+    team_dict_list, stages['build'] = timed(build, repeat)
+
+    sorted_team_list = team_dict_list
+    for engine in ('numpy', 'python'):
+        engine_formula = dict(formula, SCORING_ENGINE=engine)
+        sorted_team_list, stages[f'sort_{engine}'] = timed(
+            lambda: main.sort_teams(team_dict_list, engine_formula, False), repeat)
+
+    for output_format in ('xlsx', 'csv', 'jsonl'):
+        def output():
+            key = main.generate_output_file(sorted_team_list, True, visible_columns, False, output_dir=None,
+                                            output_format=output_format)
+            main.output_cache.discard([key])
+
+        _, stages[f'output_{output_format}'] = timed(output, repeat)
+
+    return {
+        'timestamp': datetime.now().astimezone().isoformat(),
+        'python': platform.python_version(),
+        'season': main.YEAR_INT,
+        'teams': len(team_dict_list),
+        'repeat': repeat,
+        'stages': {stage: summary(seconds) for stage, seconds in stages.items()}
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fixtures', default=main.DEFAULT_FIXTURE_DIR, help='directory of recorded pages')
+    parser.add_argument('--config', default='config.txt', help='config.txt with the formula and columns to use')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per stage')
+    parser.add_argument('--record', action='store_true', help='record the fixtures from warrennolan.com first')
+    parser.add_argument('--output', help='also append the JSON result as one line to this file')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    config = load_config(args.config)
+    # main logs to stdout, which is reserved for the JSON result
+    with contextlib.redirect_stdout(sys.stderr):
+        if args.record:
+            print(f'Recorded {record(args.fixtures, config)} team sheets to {args.fixtures}')
+        result = run_benchmark(args.fixtures, config, args.repeat)
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'a') as f:
+            f.write(json.dumps(result) + '\n')
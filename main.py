@@ -1,20 +1,86 @@
-from bs4 import BeautifulSoup
+import aiohttp
+import asyncio
+from bs4.dammit import EncodingDetector, UnicodeDammit
+from collections import OrderedDict, deque, namedtuple
+from contextlib import closing, contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
-from flask import Flask, send_file, request, Response
+from functools import cmp_to_key
+from flask import Flask, send_file, request, Response, jsonify, redirect
+import contextvars
+import csv
 import gc
+import hashlib
+import importlib.util
+import html
+import io
+import itertools
+import json
 import traceback
 import logging
+import math
+import multiprocessing
+import numpy as np
+from lxml import etree
 import os
 from pathlib import Path
 import pytz
+import random
 import requests
+import sqlite3
+import tempfile
 import time
 import threading
+import urllib3
+import uuid
 import xlsxwriter
+from xlsxwriter.utility import xl_col_to_name
 import yaml
-import queue
 
-log_queue = queue.Queue()
+LOG_BUFFER_LINES = 5000
+
+
+class LogBroadcaster:
+    """Ring buffer of log lines for the SSE status streams; each subscriber keeps its own cursor."""
+
+    def __init__(self, capacity):
+        self.lines = deque(maxlen=capacity)
+        self.next_seq = 0
+        self.run_start_seq = 0
+        self.condition = threading.Condition()
+
+    def publish(self, line):
+        with self.condition:
+            self.lines.append(line)
+            self.next_seq += 1
+            self.condition.notify_all()
+
+    def start_run(self):
+        """New subscribers replay history from here on."""
+        with self.condition:
+            self.run_start_seq = self.next_seq
+
+    def subscribe(self, last_seen_seq=None):
+        """Returns a new subscriber's cursor: after last_seen_seq, or the start of the current run."""
+        with self.condition:
+            if last_seen_seq is not None:
+                return min(last_seen_seq + 1, self.next_seq)
+            return max(self.run_start_seq, self.next_seq - len(self.lines))
+
+    def read(self, cursor, timeout=None):
+        """Waits up to timeout for lines from cursor on. Returns [(seq, line)], or None once cursor is overwritten."""
+        with self.condition:
+            if cursor >= self.next_seq:
+                self.condition.wait(timeout)
+            oldest_seq = self.next_seq - len(self.lines)
+            if cursor < oldest_seq:
+                return None
+            return [(oldest_seq + idx, self.lines[idx]) for idx in range(cursor - oldest_seq, len(self.lines))]
+
+
+log_broadcaster = LogBroadcaster(LOG_BUFFER_LINES)
+# The web job (see Job) whose log to_log writes to, if any
+current_job = contextvars.ContextVar('current_job', default=None)
 
 MONTH_INT = int(datetime.strftime(datetime.today(), '%m'))
 YEAR_INT = int(datetime.strftime(datetime.today(), '%Y'))
@@ -260,10 +326,56 @@ COL_SETTINGS = {
 
 X_WINS, Y_WINS, TIE = -1, 1, 0
 
-
-def to_log(in_str, to_stdout=True):
+# Log level for the point-by-point detail of every team comparison
+TRACE = 5
+logging.addLevelName(TRACE, 'TRACE')
+
+DEFAULT_HTTP_POOL_SIZE = 16
+DEFAULT_CACHE_DIR = '.warrennolan_cache'
+DEFAULT_CACHE_TTL_MINUTES = 60
+DEFAULT_CACHE_MAX_MB = 200
+DEFAULT_HTTP_TIMEOUT = 30
+NET_NITTY_CHUNK_SIZE = 64 * 1024
+DEFAULT_STORE_PATH = 'warrennolan.sqlite3'
+DEFAULT_FIXTURE_DIR = 'fixtures'
+DEFAULT_STORE_MAX_AGE_HOURS = 72
+DEFAULT_STORE_KEEP_SNAPSHOTS = 30
+DEFAULT_CHECKPOINT_DIR = 'checkpoints'
+DEFAULT_CHECKPOINT_MAX_AGE_HOURS = 12
+DEFAULT_HTTP_RATE_LIMIT = 0
+DEFAULT_HTTP_RETRIES = 5
+DEFAULT_HTTP_BACKOFF_SECONDS = 1
+DEFAULT_HTTP_MAX_BACKOFF_SECONDS = 60
+# responses that mean warrennolan.com is throttling us or briefly unwell
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# a response this many times slower than the fastest recent one, and slower
+# than SLOW_LATENCY_SECONDS, counts as a sign of overload
+SLOW_LATENCY_FACTOR = 4
+SLOW_LATENCY_SECONDS = 1
+http_session = None
+http_session_pool_size = None
+http_timeout = DEFAULT_HTTP_TIMEOUT
+http_retries = DEFAULT_HTTP_RETRIES
+http_backoff_seconds = DEFAULT_HTTP_BACKOFF_SECONDS
+http_max_backoff_seconds = DEFAULT_HTTP_MAX_BACKOFF_SECONDS
+http_rate_limit = None
+http_concurrency = None
+http_session_lock = threading.Lock()
+
+
+def get_logger():
+    job = current_job.get()
+    return job.logger if job is not None else logging.getLogger()
+
+
+def trace_enabled():
+    """True when comparison detail should be logged (LOG_COMPARISONS in config.txt)."""
+    return get_logger().isEnabledFor(TRACE)
+
+
+def to_log(in_str, to_stdout=True, level=logging.INFO):
     """
-    Logs a message to console, file, and SSE queue.
+    Logs a message to console, file, and SSE stream.
     Ensures multi-line messages and stack traces print line-by-line live.
     """
     if in_str is None:
@@ -272,17 +384,727 @@ def to_log(in_str, to_stdout=True):
     # Convert to string
     in_str = str(in_str)
 
+    job = current_job.get()
+
     # Print to console and browser
     if to_stdout:
         print(in_str, flush=True)
 
         # Split multi-line messages and enqueue each line separately
+        broadcaster = job.broadcaster if job is not None else log_broadcaster
         for line in in_str.splitlines():
-            # Put a line in the queue immediately for streaming
-            log_queue.put(line)
+            # Put a line in the broadcaster immediately for streaming
+            broadcaster.publish(line)
 
     # Log to file via logging
-    logging.info(in_str)
+    (job.logger if job is not None else logging.getLogger()).log(level, in_str)
+
+
+# name -> (Prometheus type, help text)
+METRICS = {
+    'warrennolan_fetch_seconds': ('histogram', 'Time to fetch one page from warrennolan.com'),
+    'warrennolan_fetch_bytes_total': ('counter', 'Page bytes downloaded from warrennolan.com'),
+    'warrennolan_fetch_retries_total': ('counter', 'Requests to warrennolan.com retried, by reason'),
+    'warrennolan_http_requests_total': ('counter', 'Responses received from warrennolan.com'),
+    'warrennolan_http_connections_total': ('counter', 'Connections opened to warrennolan.com'),
+    'warrennolan_parse_seconds': ('histogram', 'Time to parse one page'),
+    'warrennolan_comparisons_total': ('counter', 'Team comparisons made while sorting'),
+    'warrennolan_sort_seconds': ('histogram', 'Time to order the teams once'),
+    'warrennolan_output_seconds': ('histogram', 'Time to write one output file'),
+    'warrennolan_stage_seconds': ('histogram', 'Time spent in each stage of a run'),
+    'warrennolan_runs_total': ('counter', 'Finished runs by result'),
+}
+METRIC_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class MetricsRegistry:
+    """Process-wide counters and histograms, rendered in the Prometheus text format by /metrics."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (name, labels) -> value for counters, [bucket counts, sum, count] for histograms
+        self.values = {}
+
+    def observe(self, name, value, labels=()):
+        with self.lock:
+            histogram = self.values.get((name, labels))
+            if histogram is None:
+                histogram = self.values[(name, labels)] = [[0] * len(METRIC_BUCKETS), 0.0, 0]
+            for idx, bound in enumerate(METRIC_BUCKETS):
+                if value <= bound:
+                    histogram[0][idx] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def inc(self, name, amount=1, labels=()):
+        with self.lock:
+            self.values[(name, labels)] = self.values.get((name, labels), 0) + amount
+
+    def render(self):
+        with self.lock:
+            values = sorted(self.values.items(), key=lambda item: item[0])
+        lines = []
+        for name, (metric_type, help_text) in METRICS.items():
+            series = [(labels, value) for (series_name, labels), value in values if series_name == name]
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for labels, value in series:
+                if metric_type == 'counter':
+                    lines.append(f'{name}{format_labels(labels)} {value}')
+                    continue
+                bucket_counts, total, count = value
+                for bound, bucket_count in zip(METRIC_BUCKETS, bucket_counts):
+                    lines.append(f'{name}_bucket{format_labels(labels + (("le", str(bound)),))} {bucket_count}')
+                lines.append(f'{name}_bucket{format_labels(labels + (("le", "+Inf"),))} {count}')
+                lines.append(f'{name}_sum{format_labels(labels)} {total}')
+                lines.append(f'{name}_count{format_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+class RunMetrics:
+    """The samples of one do_the_work run, for the summary at the end of its log."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.counts = {}
+
+    def observe(self, name, value, labels=()):
+        with self.lock:
+            self.samples.setdefault((name, labels), []).append(value)
+
+    def inc(self, name, amount=1, labels=()):
+        with self.lock:
+            self.counts[(name, labels)] = self.counts.get((name, labels), 0) + amount
+
+    def summary(self):
+        """Returns the log lines summing up where the run's time went."""
+        with self.lock:
+            samples = {key: sorted(values) for key, values in self.samples.items()}
+            counts = dict(self.counts)
+
+        def stats(name, labels=()):
+            return samples.get((name, labels), [])
+
+        lines = ['Run timing summary:']
+        stages = [(dict(labels)['stage'], sum(values)) for (name, labels), values in samples.items()
+                  if name == 'warrennolan_stage_seconds']
+        if stages:
+            lines.append('   Stages: ' + ', '.join(f'{stage} {seconds:.2f}s' for stage, seconds in stages))
+        fetches = stats('warrennolan_fetch_seconds')
+        if fetches:
+            fetched_bytes = counts.get(('warrennolan_fetch_bytes_total', ()), 0)
+            lines.append(f'   Fetch: {len(fetches)} pages, {fetched_bytes / 1024 / 1024:.1f} MB, '
+                         f'p50 {percentile(fetches, 50):.3f}s, p95 {percentile(fetches, 95):.3f}s, '
+                         f'max {fetches[-1]:.3f}s')
+        requests_sent = counts.get(('warrennolan_http_requests_total', ()), 0)
+        if requests_sent:
+            connections = counts.get(('warrennolan_http_connections_total', ()), 0)
+            lines.append(f'   HTTP: {requests_sent} requests, {connections} connections opened, '
+                         f'{max(requests_sent - connections, 0)} reused')
+        retries = [(dict(labels)['reason'], amount) for (name, labels), amount in counts.items()
+                   if name == 'warrennolan_fetch_retries_total']
+        if retries:
+            lines.append('   Retries: ' + ', '.join(f'{reason} {amount}' for reason, amount in retries))
+        for (name, labels), values in samples.items():
+            if name == 'warrennolan_parse_seconds':
+                lines.append(f'   Parse {dict(labels)["page"]}: {len(values)} pages, {sum(values):.2f}s total, '
+                             f'p95 {percentile(values, 95):.3f}s, max {values[-1]:.3f}s')
+        for (name, labels), values in samples.items():
+            if name == 'warrennolan_sort_seconds':
+                engine = dict(labels)['engine']
+                comparisons = counts.get(('warrennolan_comparisons_total', labels), 0)
+                lines.append(f'   Sort ({engine}): {comparisons} comparisons in {sum(values):.3f}s')
+        for (name, labels), values in samples.items():
+            if name == 'warrennolan_output_seconds':
+                lines.append(f'   Output {dict(labels)["format"]}: {sum(values):.3f}s')
+        return '\n'.join(lines)
+
+
+def percentile(sorted_values, pct):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+metrics_registry = MetricsRegistry()
+current_run_metrics = contextvars.ContextVar('current_run_metrics', default=None)
+
+
+def observe(name, value, **labels):
+    """Records value in the /metrics histogram name and in the current run's summary."""
+    labels = tuple(sorted(labels.items()))
+    metrics_registry.observe(name, value, labels)
+    run_metrics = current_run_metrics.get()
+    if run_metrics is not None:
+        run_metrics.observe(name, value, labels)
+
+
+def count(name, amount=1, **labels):
+    """Adds amount to the /metrics counter name and to the current run's summary."""
+    labels = tuple(sorted(labels.items()))
+    metrics_registry.inc(name, amount, labels)
+    run_metrics = current_run_metrics.get()
+    if run_metrics is not None:
+        run_metrics.inc(name, amount, labels)
+
+
+@contextmanager
+def timer(name, **labels):
+    """Observes the time spent in the with block in the histogram name."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+class TokenBucket:
+    """Token bucket for the request rate. Never blocks: reserve returns how long to wait."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def reserve(self):
+        """Takes a token, borrowing from the future if needed. Returns the seconds to wait before using it."""
+        with self.lock:
+            self._refill()
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+
+def wake_future(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on the requests in flight to warrennolan.com."""
+
+    def __init__(self, max_limit):
+        self.max_limit = max_limit
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.min_latency = None
+        self.condition = threading.Condition()
+        # (event loop, future) of every acquire_async waiting for a slot
+        self.async_waiters = []
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.condition:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                waiter = (loop, loop.create_future())
+                self.async_waiters.append(waiter)
+            try:
+                await waiter[1]
+            finally:
+                with self.condition:
+                    if waiter in self.async_waiters:
+                        self.async_waiters.remove(waiter)
+
+    def release(self, latency, ok):
+        with self.condition:
+            self.in_flight -= 1
+            if not ok:
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                # the baseline drifts up slowly so one lucky response does not pin it forever
+                self.min_latency = latency if self.min_latency is None else min(latency, self.min_latency * 1.01)
+                if latency > max(SLOW_LATENCY_FACTOR * self.min_latency, SLOW_LATENCY_SECONDS):
+                    self.limit = max(1.0, self.limit - 1 / self.limit)
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+            async_waiters, self.async_waiters = self.async_waiters, []
+        # release runs on worker threads as well as on the event loops
+        for loop, future in async_waiters:
+            loop.call_soon_threadsafe(wake_future, future)
+
+
+class SettingsGate:
+    """Lets jobs with the same HTTP, CACHE, STORE and FIXTURES settings run together, in arrival order."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.active_key = None
+        self.active_count = 0
+        self.next_ticket = 0
+        # ticket -> settings key of the jobs waiting to get in
+        self.waiting = {}
+
+    def may_enter(self, ticket, key):
+        if self.active_count and self.active_key != key:
+            return False
+        return all(other_key == key for other_ticket, other_key in self.waiting.items() if other_ticket < ticket)
+
+    def enter(self, key):
+        with self.condition:
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            self.waiting[ticket] = key
+            if not self.may_enter(ticket, key):
+                to_log('Waiting for running jobs with different HTTP, CACHE, STORE or FIXTURES settings to finish')
+            while not self.may_enter(ticket, key):
+                self.condition.wait()
+            del self.waiting[ticket]
+            self.active_key = key
+            self.active_count += 1
+
+    def exit(self):
+        with self.condition:
+            self.active_count -= 1
+            self.condition.notify_all()
+
+
+settings_gate = SettingsGate()
+
+
+@contextmanager
+def shared_settings(config, max_workers):
+    """Applies the process-wide sections of config for the with block, see SettingsGate."""
+    sections = {section: config.get(section, {}) or {} for section in ('HTTP', 'CACHE', 'STORE', 'FIXTURES')}
+    # SCRAPE_WORKERS can raise the pool size
+    key = json.dumps([sections, max_workers], sort_keys=True, default=str)
+    settings_gate.enter(key)
+    try:
+        configure_http_session(sections['HTTP'], max_workers)
+        configure_response_cache(sections['CACHE'])
+        configure_snapshot_store(sections['STORE'])
+        configure_fixtures(sections['FIXTURES'])
+        yield
+    finally:
+        settings_gate.exit()
+
+
+def configure_http_session(http_config, min_pool_size=1):
+    """Applies the HTTP section, keeping the pool and limiters when their settings are unchanged."""
+    global http_session, http_session_pool_size, http_timeout, http_retries, http_backoff_seconds, \
+        http_max_backoff_seconds, http_rate_limit, http_concurrency
+
+    pool_size = max(int(http_config.get('POOL_SIZE', DEFAULT_HTTP_POOL_SIZE)), min_pool_size)
+    rate = float(http_config.get('RATE_LIMIT', DEFAULT_HTTP_RATE_LIMIT) or 0)
+    with http_session_lock:
+        http_timeout = http_config.get('TIMEOUT', DEFAULT_HTTP_TIMEOUT)
+        http_retries = max(int(http_config.get('RETRIES', DEFAULT_HTTP_RETRIES)), 0)
+        http_backoff_seconds = float(http_config.get('BACKOFF_SECONDS', DEFAULT_HTTP_BACKOFF_SECONDS))
+        http_max_backoff_seconds = float(http_config.get('MAX_BACKOFF_SECONDS', DEFAULT_HTTP_MAX_BACKOFF_SECONDS))
+        if http_session is not None and http_session_pool_size != pool_size:
+            http_session.close()
+            http_session = None
+        if http_session is None:
+            http_session = create_http_session(pool_size)
+            http_session_pool_size = pool_size
+        if http_concurrency is None or http_concurrency.max_limit != pool_size:
+            http_concurrency = AdaptiveConcurrency(pool_size)
+        if rate <= 0:
+            http_rate_limit = None
+        elif http_rate_limit is None or http_rate_limit.rate != rate:
+            http_rate_limit = TokenBucket(rate, max(1.0, rate))
+
+
+class CountingHTTPConnectionPool(urllib3.HTTPConnectionPool):
+    def _new_conn(self):
+        count('warrennolan_http_connections_total')
+        return super()._new_conn()
+
+
+class CountingHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    def _new_conn(self):
+        count('warrennolan_http_connections_total')
+        return super()._new_conn()
+
+
+class CountingHTTPAdapter(requests.adapters.HTTPAdapter):
+    """HTTPAdapter that counts the connections it opens in the current run's metrics."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': CountingHTTPConnectionPool,
+                                                   'https': CountingHTTPSConnectionPool}
+
+
+def create_http_session(pool_size):
+    session = requests.Session()
+    adapter = CountingHTTPAdapter(pool_connections=2, pool_maxsize=pool_size, pool_block=True)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive'
+    })
+    return session
+
+
+def get_http_session():
+    global http_session, http_session_pool_size
+
+    with http_session_lock:
+        if fixture_session is not None:
+            return fixture_session
+        if http_session is None:
+            http_session = create_http_session(DEFAULT_HTTP_POOL_SIZE)
+            http_session_pool_size = DEFAULT_HTTP_POOL_SIZE
+        return http_session
+
+
+def get_http_concurrency():
+    global http_concurrency
+
+    with http_session_lock:
+        if http_concurrency is None:
+            http_concurrency = AdaptiveConcurrency(http_session_pool_size or DEFAULT_HTTP_POOL_SIZE)
+        return http_concurrency
+
+
+def replaying_fixtures():
+    store = fixture_store
+    return store is not None and store.mode == 'replay'
+
+
+def using_fixtures():
+    # Recording or replaying has to see every request, and live runs must not
+    # pick up recorded pages, so the cache, the shared snapshot, the store and
+    # checkpoints are all bypassed while FIXTURES MODE is record or replay.
+    return fixture_store is not None
+
+
+def retry_delay(attempt, retry_after=None):
+    """Exponential backoff with jitter before retry number attempt, at least the server's Retry-After."""
+    delay = min(http_max_backoff_seconds, http_backoff_seconds * 2 ** (attempt - 1))
+    delay = delay / 2 + random.uniform(0, delay / 2)
+    try:
+        return max(delay, min(float(retry_after), http_max_backoff_seconds))
+    except (TypeError, ValueError):
+        return delay
+
+
+def retry_or_raise(url, attempt, reason, error, retry_after=None):
+    """Returns the seconds to wait before trying url again, or raises error once the retries are used up."""
+    if attempt > http_retries:
+        raise error
+    count('warrennolan_fetch_retries_total', reason=reason)
+    delay = retry_delay(attempt, retry_after)
+    to_log(f'   {url}: {error}. Retry {attempt} of {http_retries} in {delay:.1f}s')
+    return delay
+
+
+def http_get(url, headers=None, stream=False):
+    """Every request to warrennolan.com goes through here: rate limit, concurrency limit and retries."""
+    session = get_http_session()
+    if replaying_fixtures():
+        return session.get(url, headers=headers, stream=stream, timeout=http_timeout)
+    concurrency = get_http_concurrency()
+    for attempt in itertools.count(1):
+        page = None
+        concurrency.acquire()
+        start = time.perf_counter()
+        try:
+            rate_limit = http_rate_limit
+            if rate_limit is not None:
+                time.sleep(rate_limit.reserve())
+            start = time.perf_counter()
+            page = session.get(url, headers=headers, stream=stream, timeout=http_timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        finally:
+            # released on every way out, or the slot would be lost for good
+            latency = time.perf_counter() - start
+            concurrency.release(latency, ok=page is not None and page.status_code not in RETRY_STATUSES)
+        if page is None:
+            reason = 'timeout' if isinstance(error, requests.Timeout) else 'connection'
+            time.sleep(retry_or_raise(url, attempt, reason, error))
+            continue
+        observe('warrennolan_fetch_seconds', latency)
+        count('warrennolan_http_requests_total')
+        if page.status_code not in RETRY_STATUSES:
+            if not stream:
+                count('warrennolan_fetch_bytes_total', len(page.content))
+            return page
+        page.close()
+        error = requests.HTTPError(f'HTTP {page.status_code} from {url}', response=page)
+        time.sleep(retry_or_raise(url, attempt, str(page.status_code), error, page.headers.get('Retry-After')))
+
+
+class FixtureStore:
+    """Directory of recorded warrennolan.com pages for FIXTURES MODE record and replay."""
+    # the body is stored decoded, so these no longer describe it
+    DROPPED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection'}
+
+    def __init__(self, fixture_dir, mode):
+        self.fixture_dir = Path(fixture_dir)
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.fixture_dir.mkdir(parents=True, exist_ok=True)
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return self.fixture_dir / f'{key}.body', self.fixture_dir / f'{key}.json'
+
+    def load(self, url):
+        """Returns (status, headers, body) recorded for url or None."""
+        body_path, meta_path = self._paths(url)
+        try:
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+            return meta['status'], meta['headers'], body_path.read_bytes()
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, url, status, headers, body):
+        body_path, meta_path = self._paths(url)
+        headers = {name: value for name, value in headers.items() if name.lower() not in self.DROPPED_HEADERS}
+        with self.lock:
+            body_path.write_bytes(body)
+            meta_path.write_text(json.dumps({'url': url, 'status': status, 'headers': headers}), encoding='utf-8')
+
+    def replay(self, url):
+        """load() for MODE: replay, where a page that was never recorded is an error."""
+        fixture = self.load(url)
+        if fixture is None:
+            raise requests.ConnectionError(f'No recorded fixture for {url} in {self.fixture_dir}')
+        return fixture
+
+
+class FixtureAdapter(requests.adapters.BaseAdapter):
+    """Records the wrapped adapter's responses into a FixtureStore, or replays them."""
+
+    def __init__(self, store, adapter):
+        super().__init__()
+        self.store = store
+        self.adapter = adapter
+
+    @property
+    def poolmanager(self):
+        return self.adapter.poolmanager
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        if self.store.mode == 'replay':
+            status, headers, body = self.store.replay(request.url)
+        else:
+            page = self.adapter.send(request, stream=False, timeout=timeout, verify=verify, cert=cert,
+                                     proxies=proxies)
+            status, headers, body = page.status_code, dict(page.headers), page.content
+            if status == 200:
+                self.store.save(request.url, status, headers, body)
+
+        response = requests.Response()
+        response.status_code = status
+        response.headers = requests.structures.CaseInsensitiveDict(headers)
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.raw = io.BytesIO(body)
+        response.url = request.url
+        response.request = request
+        if not stream:
+            response.content
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+fixture_store = None
+fixture_session = None
+
+
+def configure_fixtures(fixture_config):
+    """Applies the FIXTURES section on a session of its own, so live runs are not affected."""
+    global fixture_store, fixture_session
+
+    mode = str(fixture_config.get('MODE', 'off') or 'off').lower()
+    if mode not in ('off', 'record', 'replay'):
+        raise ValueError(f'Unknown FIXTURES MODE {mode}, pick one of off, record, replay')
+    fixture_dir = Path(fixture_config.get('DIRECTORY', DEFAULT_FIXTURE_DIR))
+    with http_session_lock:
+        if fixture_store is not None and (fixture_store.mode, fixture_store.fixture_dir) == (mode, fixture_dir):
+            return
+        if fixture_session is not None:
+            fixture_session.close()
+        if mode == 'off':
+            fixture_store, fixture_session = None, None
+            return
+        fixture_store = FixtureStore(fixture_dir, mode)
+        fixture_session = create_http_session(http_session_pool_size or DEFAULT_HTTP_POOL_SIZE)
+        for prefix in ('http://', 'https://'):
+            fixture_session.mount(prefix, FixtureAdapter(fixture_store, fixture_session.get_adapter(prefix)))
+
+
+class ResponseCache:
+    """On-disk LRU cache of page bodies keyed by URL, revalidated with ETag / Last-Modified after the TTL."""
+
+    def __init__(self, cache_dir, ttl_seconds, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # key -> [body size, last used timestamp]
+        self.index = {}
+        for body_path in self.cache_dir.glob('*.body'):
+            stat = body_path.stat()
+            self.index[body_path.stem] = [stat.st_size, stat.st_mtime]
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return key, self.cache_dir / f'{key}.body', self.cache_dir / f'{key}.json'
+
+    def get(self, url):
+        """Returns the cached entry for url (without its body) or None."""
+        key, body_path, meta_path = self._paths(url)
+        with self.lock:
+            if key not in self.index:
+                return None
+            try:
+                with open(meta_path, 'r') as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                self._remove(key)
+                return None
+
+    def is_fresh(self, entry):
+        return time.time() - entry['fetched_at'] < self.ttl_seconds
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def read(self, url):
+        """Returns the cached body for url and marks it as recently used, or None."""
+        key, body_path, meta_path = self._paths(url)
+        with self.lock:
+            try:
+                with open(body_path, 'rb') as f:
+                    content = f.read()
+            except OSError:
+                self._remove(key)
+                return None
+            now = time.time()
+            os.utime(body_path, (now, now))
+            self.index[key] = [len(content), now]
+        return content
+
+    def store(self, url, content, headers):
+        key, body_path, meta_path = self._paths(url)
+        entry = {
+            'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'fetched_at': time.time()
+        }
+        with self.lock:
+            with open(body_path, 'wb') as f:
+                f.write(content)
+            self._write_meta(meta_path, entry)
+            self.index[key] = [len(content), entry['fetched_at']]
+            self._evict()
+
+    def revalidated(self, url, entry):
+        """The server answered 304 Not Modified, so entry is fresh again."""
+        key, body_path, meta_path = self._paths(url)
+        entry['fetched_at'] = time.time()
+        with self.lock:
+            self._write_meta(meta_path, entry)
+
+    @staticmethod
+    def _write_meta(meta_path, entry):
+        tmp_path = meta_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, meta_path)
+
+    def _remove(self, key):
+        self.index.pop(key, None)
+        for suffix in ('.body', '.json'):
+            try:
+                (self.cache_dir / f'{key}{suffix}').unlink()
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        total_bytes = sum(size for size, last_used in self.index.values())
+        if total_bytes <= self.max_bytes:
+            return
+        for key, (size, last_used) in sorted(self.index.items(), key=lambda item: item[1][1]):
+            self._remove(key)
+            total_bytes -= size
+            if total_bytes <= self.max_bytes:
+                break
+
+
+response_cache = None
+
+
+def configure_response_cache(cache_config):
+    global response_cache
+
+    if not cache_config.get('ENABLED', False):
+        response_cache = None
+        return
+    cache_dir = cache_config.get('DIRECTORY', DEFAULT_CACHE_DIR)
+    ttl_seconds = float(cache_config.get('TTL_MINUTES', DEFAULT_CACHE_TTL_MINUTES)) * 60
+    max_bytes = int(float(cache_config.get('MAX_MB', DEFAULT_CACHE_MAX_MB)) * 1024 * 1024)
+    if response_cache is None or response_cache.cache_dir != Path(cache_dir):
+        response_cache = ResponseCache(cache_dir, ttl_seconds, max_bytes)
+    else:
+        response_cache.ttl_seconds, response_cache.max_bytes = ttl_seconds, max_bytes
+
+
+def cached_http_get(url):
+    """Returns the body of url, going through response_cache when it is enabled."""
+    cache = response_cache if not using_fixtures() else None
+    if cache is None:
+        return http_get(url).content
+
+    entry = cache.get(url)
+    if entry and cache.is_fresh(entry):
+        content = cache.read(url)
+        if content is not None:
+            return content
+
+    page = http_get(url, headers=cache.conditional_headers(entry))
+    if page.status_code == 304 and entry:
+        content = cache.read(url)
+        if content is not None:
+            cache.revalidated(url, entry)
+            return content
+        page = http_get(url)
+    if page.status_code == 200:
+        cache.store(url, page.content, page.headers)
+    return page.content
 
 
 def record_to_wins_and_losses(in_record):
@@ -291,7 +1113,7 @@ def record_to_wins_and_losses(in_record):
 
 
 def compare_record(x_wins, x_losses, y_wins, y_losses, metric_pts, x_pts,
-                   y_pts, new_record_comparison):
+                   y_pts, new_record_comparison, trace=False):
     if new_record_comparison:
         if x_wins > y_wins and x_wins > 0:
             x_pts += metric_pts
@@ -304,8 +1126,8 @@ def compare_record(x_wins, x_losses, y_wins, y_losses, metric_pts, x_pts,
                 x_pts += metric_pts
             elif y_losses < x_losses:
                 y_pts += metric_pts
-            else:
-                to_log('      No points awarded due to W-L tie', to_stdout=False)
+            elif trace:
+                to_log('      No points awarded due to W-L tie', to_stdout=False, level=TRACE)
     else:
         if x_wins == 0 and y_wins > 0:
             y_pts += metric_pts
@@ -336,18 +1158,20 @@ def compare_record(x_wins, x_losses, y_wins, y_losses, metric_pts, x_pts,
     return x_pts, y_pts
 
 
-def compare_records(records_tup_list, x, y, x_pts, y_pts,
-                    new_record_comparison):
-    for metric_prefix, metric_pts in records_tup_list:
-        x_pts, y_pts = compare_record(x[metric_prefix + '_wins'],
-                                      x[metric_prefix + '_losses'],
-                                      y[metric_prefix + '_wins'],
-                                      y[metric_prefix + '_losses'], metric_pts,
-                                      x_pts, y_pts, new_record_comparison)
-        to_log(
-            f'      {metric_prefix} record for {metric_pts} points ||| {x["team"]} {x_pts} - {y["team"]} {y_pts}',
-            to_stdout=False
-        )
+def compare_records(records_idx_list, x, y, x_pts, y_pts,
+                    new_record_comparison, trace=False):
+    x_values, y_values = x.values, y.values
+    for metric_prefix, wins_idx, losses_idx, metric_pts in records_idx_list:
+        x_pts, y_pts = compare_record(x_values[wins_idx],
+                                      x_values[losses_idx],
+                                      y_values[wins_idx],
+                                      y_values[losses_idx], metric_pts,
+                                      x_pts, y_pts, new_record_comparison, trace)
+        if trace:
+            to_log(
+                f'      {metric_prefix} record for {metric_pts} points ||| {x["team"]} {x_pts} - {y["team"]} {y_pts}',
+                to_stdout=False, level=TRACE
+            )
 
     return x_pts, y_pts
 
@@ -360,20 +1184,22 @@ def compare_metric(x_metric, y_metric, metric_pts, x_pts, y_pts):
     return x_pts, y_pts
 
 
-def compare_metrics(metrics_tup_list, x, y, x_pts, y_pts):
-    for metric_key, metric_pts in metrics_tup_list:
-        x_pts, y_pts = compare_metric(x[metric_key], y[metric_key], metric_pts,
+def compare_metrics(metrics_idx_list, x, y, x_pts, y_pts, trace=False):
+    x_values, y_values = x.values, y.values
+    for metric_key, metric_idx, metric_pts in metrics_idx_list:
+        x_pts, y_pts = compare_metric(x_values[metric_idx], y_values[metric_idx], metric_pts,
                                       x_pts, y_pts)
-        to_log(
-            f'      {metric_key} for {metric_pts} points ||| {x["team"]} {x_pts} - {y["team"]} {y_pts}',
-            to_stdout=False
-        )
+        if trace:
+            to_log(
+                f'      {metric_key} for {metric_pts} points ||| {x["team"]} {x_pts} - {y["team"]} {y_pts}',
+                to_stdout=False, level=TRACE
+            )
 
     return x_pts, y_pts
 
 
-def compare_teams(x, y, formula, select_mode):
-    x_pts, y_pts = 0.0, 0.0
+def formula_tup_lists(formula, select_mode):
+    """Returns the (metric, points) and (record prefix, points) lists for a formula."""
     SELECT = 'SELECT_' if select_mode else ''
 
     METRICS_TUP_LIST = [
@@ -398,64 +1224,319 @@ def compare_teams(x, y, formula, select_mode):
         ('q1_q2', formula.get('Q1_AND_Q2_PTS'))
     ]
 
-    x_pts, y_pts = compare_metrics(METRICS_TUP_LIST, x, y, x_pts, y_pts)
-    x_pts, y_pts = compare_records(RECORDS_TUP_LIST, x, y, x_pts, y_pts,
-                                   formula.get('NEW_RECORD_COMPARISON', True))
+    return METRICS_TUP_LIST, RECORDS_TUP_LIST
 
+
+def formula_idx_lists(formula, select_mode):
+    """formula_tup_lists with the TeamRecord.values index of every metric and record added."""
+    METRICS_TUP_LIST, RECORDS_TUP_LIST = formula_tup_lists(formula, select_mode)
+    metrics_idx_list = [(metric_key, VALUE_INDEX[metric_key], metric_pts)
+                        for metric_key, metric_pts in METRICS_TUP_LIST]
+    records_idx_list = [(metric_prefix, VALUE_INDEX[metric_prefix + '_wins'], VALUE_INDEX[metric_prefix + '_losses'],
+                         metric_pts) for metric_prefix, metric_pts in RECORDS_TUP_LIST]
+    return metrics_idx_list, records_idx_list
+
+
+def compare_teams(x, y, formula, select_mode, idx_lists=None):
+    """idx_lists is formula_idx_lists(formula, select_mode), passed in by callers comparing many pairs."""
+    x_pts, y_pts = 0.0, 0.0
+    metrics_idx_list, records_idx_list = idx_lists or formula_idx_lists(formula, select_mode)
+    trace = trace_enabled()
+
+    x_pts, y_pts = compare_metrics(metrics_idx_list, x, y, x_pts, y_pts, trace)
+    x_pts, y_pts = compare_records(records_idx_list, x, y, x_pts, y_pts,
+                                   formula.get('NEW_RECORD_COMPARISON', True), trace)
+
+    x_values, y_values = x.values, y.values
     conf_leader_pts = formula.get('CONF_LEADER_PTS')
-    if x['conf_leader']:
+    if x_values[CONF_LEADER_IDX]:
         x_pts += conf_leader_pts
-    if y['conf_leader']:
+    if y_values[CONF_LEADER_IDX]:
         y_pts += conf_leader_pts
 
     bad_nc_sos_deduct_pts = formula.get('BAD_NC_SOS_DEDUCT_PTS')
     bad_nc_sos_deduct_thresold = formula.get('BAD_NC_SOS_DEDUCT_THRESHOLD')
-    if x['nc_sos'] >= bad_nc_sos_deduct_thresold:
+    if x_values[NC_SOS_IDX] >= bad_nc_sos_deduct_thresold:
         x_pts -= bad_nc_sos_deduct_pts
-    if y['nc_sos'] >= bad_nc_sos_deduct_thresold:
+    if y_values[NC_SOS_IDX] >= bad_nc_sos_deduct_thresold:
         y_pts -= bad_nc_sos_deduct_pts
 
     if x_pts > y_pts:
-        point_diff = x_pts - y_pts
-        point_suffix = 's' if point_diff > 1 else ''
-        to_log(
-            f'   {x["team"]} > {y["team"]} by {x_pts - y_pts} point{point_suffix} | ({x_pts} - {y_pts})'
-        )
+        if trace:
+            point_diff = x_pts - y_pts
+            point_suffix = 's' if point_diff > 1 else ''
+            to_log(
+                f'   {x["team"]} > {y["team"]} by {x_pts - y_pts} point{point_suffix} | ({x_pts} - {y_pts})',
+                level=TRACE
+            )
         return -1
     elif y_pts > x_pts:
-        point_diff = y_pts - x_pts
-        point_suffix = 's' if point_diff > 1 else ''
-        to_log(
-            f'   {y["team"]} > {x["team"]} by {y_pts - x_pts} point{point_suffix} | ({y_pts} - {x_pts})',
-            to_stdout=False
-        )
+        if trace:
+            point_diff = y_pts - x_pts
+            point_suffix = 's' if point_diff > 1 else ''
+            to_log(
+                f'   {y["team"]} > {x["team"]} by {y_pts - x_pts} point{point_suffix} | ({y_pts} - {x_pts})',
+                to_stdout=False, level=TRACE
+            )
         return 1
     else:
-        if x['net'] < y['net']:
-            to_log('   %s > %s due to NET ranking' % (x['team'], y['team']), to_stdout=False)
-        else:
-            to_log('   %s > %s due to NET ranking' % (y['team'], x['team']), to_stdout=False)
-        return x['net'] - y['net']
+        if trace:
+            if x.net < y.net:
+                to_log('   %s > %s due to NET ranking' % (x.team, y.team), to_stdout=False, level=TRACE)
+            else:
+                to_log('   %s > %s due to NET ranking' % (y.team, x.team), to_stdout=False, level=TRACE)
+        return x.net - y.net
+
+
+class SoupTextTarget:
+    """lxml parser target that rebuilds BeautifulSoup(content, 'html.parser').text without a tree."""
+    SKIPPED_TAGS = {'script', 'style', 'template'}
+    PRESERVE_WHITESPACE_TAGS = {'pre', 'textarea'}
+    ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+
+    def __init__(self):
+        self.strings = []
+        self.pending = []
+        self.skip_depth = 0
+        self.preserve_depth = 0
+
+    def end_string(self):
+        if not self.pending:
+            return
+        string = ''.join(self.pending)
+        self.pending = []
+        if self.skip_depth:
+            return
+        if not self.preserve_depth and not string.strip(self.ASCII_SPACES):
+            string = '\n' if '\n' in string else ' '
+        self.add_string(string)
+
+    def add_string(self, string):
+        self.strings.append(string)
+
+    def start(self, tag, attrib):
+        self.end_string()
+        if tag in self.SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif tag in self.PRESERVE_WHITESPACE_TAGS:
+            self.preserve_depth += 1
+
+    def end(self, tag):
+        self.end_string()
+        if tag in self.SKIPPED_TAGS:
+            self.skip_depth = max(self.skip_depth - 1, 0)
+        elif tag in self.PRESERVE_WHITESPACE_TAGS:
+            self.preserve_depth = max(self.preserve_depth - 1, 0)
+
+    def data(self, data):
+        self.pending.append(data)
+
+    def comment(self, text):
+        self.end_string()
+
+    def pi(self, target, data=None):
+        self.end_string()
+
+    def doctype(self, *args):
+        self.end_string()
+
+    def close(self):
+        self.end_string()
+        return ''.join(self.strings)
+
+
+def team_sheet_text(content):
+    """Returns the text of a team sheet, computed once."""
+    markup = UnicodeDammit(content, is_html=True).unicode_markup
+    return etree.fromstring(markup, etree.HTMLParser(target=SoupTextTarget()))
+
+
+NetNittyRow = namedtuple('NetNittyRow', [
+    'net', 'team', 'conf', 'conf_record', 'overall_record', 'sos', 'nc_record', 'nc_sos', 'home_record',
+    'road_record', 'neutral_record', 'q1_record', 'q2_record', 'q3_record', 'q4_record', 'avg_net_wins',
+    'avg_net_losses', 'conf_leader', 'ineligible'
+])
+
+
+class NetNittyTableTarget(SoupTextTarget):
+    """lxml parser target that turns the rows of the first NET nitty table into NetNittyRows."""
+
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+        self.done = False
+        self.table_depth = 0
+        self.row_count = 0
+        self.row = None
+        self.cell_style = None
+
+    def start(self, tag, attrib):
+        super().start(tag, attrib)
+        if self.done:
+            return
+        if tag == 'table':
+            self.table_depth += 1
+        elif self.table_depth == 1 and tag == 'tr':
+            self.row = []
+        elif self.table_depth == 1 and tag in ('td', 'th') and self.row is not None:
+            self.strings = []
+            self.cell_style = attrib.get('style', '')
+
+    def end(self, tag):
+        super().end(tag)
+        if self.done:
+            return
+        if tag == 'table':
+            self.table_depth -= 1
+            self.done = self.table_depth == 0
+        elif self.table_depth == 1 and tag in ('td', 'th') and self.cell_style is not None:
+            self.row.append((''.join(self.strings), self.cell_style))
+            self.cell_style = None
+        elif self.table_depth == 1 and tag == 'tr' and self.row is not None:
+            row, self.row = self.row, None
+            self.row_count += 1
+            # the first row, and any repeat of it, is the header
+            if self.row_count > 1 and row and not row[0][0].startswith('NET\n'):
+                self.rows.append(cleanse_team_data(row))
+
+    def add_string(self, string):
+        if self.cell_style is not None:
+            self.strings.append(string)
+
+    def close(self):
+        self.end_string()
+        return self.rows
+
+
+TeamFeatures = namedtuple('TeamFeatures', [
+    'metrics', 'record_wins', 'record_losses', 'conf_leader', 'nc_sos', 'net'
+])
+FEATURE_METRICS = ['sor', 'combined_q3_q4_losses', 'q4_losses', 'kpi', 'wab', 'nc_sos', 'bpi', 'pom', 't_rank']
+FEATURE_RECORDS = ['al', 'road_neutral', 'high_q1', 'high_q1_rn', 'q1', 'q1_q2']
+# Layout of TeamRecord.values
+TEAM_VALUE_KEYS = (FEATURE_METRICS + [prefix + '_wins' for prefix in FEATURE_RECORDS] +
+                   [prefix + '_losses' for prefix in FEATURE_RECORDS] + ['conf_leader', 'net'])
+VALUE_INDEX = {key: idx for idx, key in enumerate(TEAM_VALUE_KEYS)}
+RECORDS_START = len(FEATURE_METRICS)
+CONF_LEADER_IDX, NC_SOS_IDX, NET_IDX = VALUE_INDEX['conf_leader'], VALUE_INDEX['nc_sos'], VALUE_INDEX['net']
+
+
+def build_team_features(team_list):
+    """Packs the fields compare_teams looks at into arrays, one row per team."""
+    values = np.array([team.values for team in team_list], dtype=np.int64).reshape(len(team_list),
+                                                                                 len(TEAM_VALUE_KEYS))
+    records_end = RECORDS_START + len(FEATURE_RECORDS)
+    return TeamFeatures(
+        metrics=values[:, :RECORDS_START],
+        record_wins=values[:, RECORDS_START:records_end],
+        record_losses=values[:, records_end:records_end + len(FEATURE_RECORDS)],
+        conf_leader=values[:, CONF_LEADER_IDX].astype(bool),
+        nc_sos=values[:, NC_SOS_IDX],
+        net=values[:, NET_IDX]
+    )
+
+
+def record_points_won(x_wins, x_losses, y_wins, y_losses, new_record_comparison):
+    """Vectorized compare_record: True where x earns the points against y."""
+    if new_record_comparison:
+        return (x_wins > y_wins) | ((x_wins == y_wins) & (x_wins > 0) & (x_losses < y_losses))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_winning_pct = np.where(x_wins > 0, x_wins / (x_wins + x_losses), 0.0)
+        y_winning_pct = np.where(y_wins > 0, y_wins / (y_wins + y_losses), 0.0)
+    x_over_500, y_over_500 = x_wins - x_losses, y_wins - y_losses
+    both_played = (x_wins > 0) & (y_wins > 0)
+    return ((x_wins > 0) & (y_wins == 0)) | (both_played & (
+        (x_over_500 > y_over_500) |
+        ((x_over_500 == y_over_500) & ((x_winning_pct > y_winning_pct) |
+                                       ((x_winning_pct == y_winning_pct) & (x_wins > y_wins))))))
+
+
+def points_matrix(features, formula, select_mode):
+    """[i, j] is what team i scores against team j, added up in compare_teams' order."""
+    METRICS_TUP_LIST, RECORDS_TUP_LIST = formula_tup_lists(formula, select_mode)
+    new_record_comparison = formula.get('NEW_RECORD_COMPARISON', True)
+    team_count = len(features.net)
+    points = np.zeros((team_count, team_count))
+
+    for metric_idx, (metric_key, metric_pts) in enumerate(METRICS_TUP_LIST):
+        metric = features.metrics[:, metric_idx]
+        points += (metric[:, None] < metric[None, :]) * (metric_pts or 0)
+
+    for record_idx, (metric_prefix, metric_pts) in enumerate(RECORDS_TUP_LIST):
+        wins = features.record_wins[:, record_idx]
+        losses = features.record_losses[:, record_idx]
+        points += record_points_won(wins[:, None], losses[:, None], wins[None, :], losses[None, :],
+                                    new_record_comparison) * (metric_pts or 0)
+
+    points += (features.conf_leader * (formula.get('CONF_LEADER_PTS') or 0))[:, None]
+    bad_nc_sos = features.nc_sos >= formula.get('BAD_NC_SOS_DEDUCT_THRESHOLD')
+    points -= (bad_nc_sos * (formula.get('BAD_NC_SOS_DEDUCT_PTS') or 0))[:, None]
+    return points
+
+
+def comparison_matrix(features, formula, select_mode):
+    """Returns an n x n matrix where [i, j] is compare_teams(team i, team j)."""
+    points = points_matrix(features, formula, select_mode)
+    net_diff = features.net[:, None] - features.net[None, :]
+    return np.where(points > points.T, X_WINS, np.where(points.T > points, Y_WINS, net_diff))
+
+
+def make_matrix_comparator(team_list, results):
+    """Comparator for the team dicts in team_list backed by comparison_matrix results."""
+    index_of = {id(team_dict): idx for idx, team_dict in enumerate(team_list)}
+
+    def team_comparator(x, y):
+        return int(results[index_of[id(x)], index_of[id(y)]])
+
+    return team_comparator
 
 
-def get_team_stats(in_team, at_large_teams):
+def get_team_url(in_team):
+    """Returns the team's URL slug and its team sheet URL."""
     in_team = (in_team.replace(' ', '-').replace("'", "").replace('&', '').replace('(', '').replace(')', '').replace('.', '').replace('--', '-'))
-    team_url = TEAM_URL_TEMPLATE + in_team
-    page = requests.get(team_url)
+    return in_team, TEAM_URL_TEMPLATE + in_team
+
+
+def get_team_sheet(in_team, snapshot=None):
+    if snapshot is None:
+        return fetch_team_sheet(in_team)
+    return snapshot.get(('team', in_team), lambda: fetch_team_sheet(in_team))
+
+
+def get_team_stats(in_team, at_large_teams, snapshot=None):
+    return team_stats_from_sheet(get_team_sheet(in_team, snapshot), at_large_teams)
+
+
+def fetch_team_sheet(in_team):
+    team_slug, team_url = get_team_url(in_team)
+    content = cached_http_get(team_url)
+    with timer('warrennolan_parse_seconds', page='team_sheet'):
+        return parse_team_sheet(content, team_slug, team_url)
+
+
+TeamSheet = namedtuple('TeamSheet', ['team_url', 'kpi', 'sor', 'wab', 'bpi', 'pom', 't_rank', 'games'])
+
+# One game from the quadrant tables of a team sheet. section is the block the
+# game is listed under: HIGH_Q1_SECTION for the 'H: 1-15' part of Quadrant 1,
+# otherwise 'Q1' to 'Q4'.
+GameResult = namedtuple('GameResult', ['location', 'opponent', 'team_score', 'opponent_score', 'section'])
+HIGH_Q1_SECTION = 'Q1 high'
+
+
+def parse_team_sheet(content, in_team, team_url):
+    """Parses a team sheet into the rankings and a game log, independent of config.txt."""
     team_hyperlink = f'=HYPERLINK("{team_url}", "{in_team}")'
-    soup = BeautifulSoup(page.content, 'html.parser')
-    del page
+    page_text = team_sheet_text(content)
 
-    al_wins, al_losses = 0, 0
-    high_q1_wins, high_q1_losses = 0, 0
-    high_q1_rn_wins, high_q1_rn_losses = 0, 0
-    on_high_q1 = True
-    idx_offset = {0: 63, 1: 64, 2: 68, 3: 69}
+    games = []
+    quadrant = 1
+    section = HIGH_Q1_SECTION
     ####### Need to find anchor for KPI on team page to get starting index
     ####### Then split on \n and parse
-    kpi_idx = soup.text.find('KPI:\n')
+    kpi_idx = page_text.find('KPI:\n')
 
-    line_split = soup.text[kpi_idx:].split('\n')
+    line_split = page_text[kpi_idx:].split('\n')
     kpi = line_split[5].strip()
     sor = line_split[6].strip()
     wab = line_split[7].strip()
@@ -464,38 +1545,26 @@ def get_team_stats(in_team, at_large_teams):
     pom = line_split[20].strip()
     t_rank = line_split[21].strip()
 
-    q1_idx = soup.text[kpi_idx:].find('H: 1-15 |')
-    line_split = soup.text[kpi_idx + q1_idx:].split('\n')
-    del soup
+    q1_idx = page_text[kpi_idx:].find('H: 1-15 |')
+    line_split = page_text[kpi_idx + q1_idx:].split('\n')
+    del page_text
     line_idx = 10
     while line_idx < len(line_split):
         line = line_split[line_idx]
         if line.isnumeric():
             location, opponent, team_score, opponent_score = line_split[
                 line_idx + 1:line_idx + 5]
-            if on_high_q1:
-                if int(team_score) > int(opponent_score):
-                    high_q1_wins += 1
-                    if location in ('A', 'N'):
-                        high_q1_rn_wins += 1
-                else:
-                    high_q1_losses += 1
-                    if location in ('A', 'N'):
-                        high_q1_rn_losses += 1
-
-            if opponent in at_large_teams:
-                if int(team_score) > int(opponent_score):
-                    al_wins += 1
-                else:
-                    al_losses += 1
+            games.append(GameResult(location, opponent, int(team_score), int(opponent_score), section))
             line_idx += 8
         elif line.startswith('H: '):
-            on_high_q1 = False
+            section = f'Q{quadrant}'
             line_idx += 10
         elif line == '':
             line_idx += 1
             continue
         elif line.startswith('Quadrant'):
+            quadrant += 1
+            section = f'Q{quadrant}'
             line_idx += 17
         elif line.startswith('Non-Division I Games'):
             break
@@ -503,6 +1572,45 @@ def get_team_stats(in_team, at_large_teams):
             to_log(f'Unexpected line on {in_team} team sheet:')
             to_log(f'{line}')
 
+    return TeamSheet(team_hyperlink, kpi, sor, wab, bpi, pom, t_rank, games)
+
+
+def high_q1_records(games):
+    """Returns (wins, losses, road/neutral wins, road/neutral losses) in the high Q1 section of a game log."""
+    high_q1_wins, high_q1_losses = 0, 0
+    high_q1_rn_wins, high_q1_rn_losses = 0, 0
+    for game in games:
+        if game.section != HIGH_Q1_SECTION:
+            continue
+        if game.team_score > game.opponent_score:
+            high_q1_wins += 1
+            if game.location in ('A', 'N'):
+                high_q1_rn_wins += 1
+        else:
+            high_q1_losses += 1
+            if game.location in ('A', 'N'):
+                high_q1_rn_losses += 1
+    return high_q1_wins, high_q1_losses, high_q1_rn_wins, high_q1_rn_losses
+
+
+def at_large_record(games, at_large_teams):
+    """Returns (wins, losses) against the AT_LARGE teams in a game log."""
+    al_wins, al_losses = 0, 0
+    for game in games:
+        if game.opponent in at_large_teams:
+            if game.team_score > game.opponent_score:
+                al_wins += 1
+            else:
+                al_losses += 1
+    return al_wins, al_losses
+
+
+def team_stats_from_sheet(team_sheet, at_large_teams):
+    """Derives the records of a parsed team sheet and returns the get_team_stats tuple."""
+    team_hyperlink, kpi, sor, wab, bpi, pom, t_rank, games = team_sheet
+    high_q1_wins, high_q1_losses, high_q1_rn_wins, high_q1_rn_losses = high_q1_records(games)
+    al_wins, al_losses = at_large_record(games, at_large_teams)
+
     high_q1_record = '%s-%s' % (str(high_q1_wins), str(high_q1_losses))
     high_q1_rn_record = '%s-%s' % (str(high_q1_rn_wins),
                                    str(high_q1_rn_losses))
@@ -512,13 +1620,466 @@ def get_team_stats(in_team, at_large_teams):
            high_q1_rn_wins, high_q1_rn_losses, al_record, al_wins, al_losses
 
 
-def generate_output_file(sorted_input, jordan_formula, visible_columns, select_mode):
+class ScrapeSnapshot:
+    """
+    The NET nitty rows and team sheets of one season, shared by the jobs that start while it is
+    fresh. Each item is fetched once; a failed fetch is retried by the next caller.
+    """
+
+    def __init__(self, season, previous=None, max_reuse_age_seconds=0):
+        self.season = season
+        self.created_at = time.time()
+        self.lock = threading.Lock()
+        self.futures = {}
+        self.previous = previous or {}
+        self.max_reuse_age_seconds = max_reuse_age_seconds
+        self.resumed = {}
+        # team -> when its team sheet was fetched from warrennolan.com
+        self.fetched_at = {}
+        self.reused_count = 0
+        self.resumed_count = 0
+
+    def claim(self, key):
+        """Returns the future for key and whether the caller has to fetch it."""
+        with self.lock:
+            future = self.futures.get(key)
+            if future is not None:
+                return future, False
+            future = self.futures[key] = Future()
+            return future, True
+
+    def fail(self, key, future, exc):
+        with self.lock:
+            if self.futures.get(key) is future:
+                del self.futures[key]
+        future.set_exception(exc)
+
+    def resume(self, stored_sheets):
+        """Adds {team: StoredTeamSheet} left by an earlier attempt at the same run."""
+        with self.lock:
+            self.resumed.update(stored_sheets)
+
+    def is_current(self, team, stored, max_age_seconds):
+        if stored is None or time.time() - stored.fetched_at >= max_age_seconds:
+            return False
+        row = self.net_rows_by_team().get(team)
+        return row is not None and net_row_key(row) == stored.row_key
+
+    def reuse(self, key):
+        """Returns the checkpointed or saved team sheet for key if it is still current, else None."""
+        if key[0] != 'team':
+            return None
+        team = key[1]
+        resumed, previous = self.resumed.get(team), self.previous.get(team)
+        if self.is_current(team, resumed, math.inf):
+            with self.lock:
+                self.fetched_at[team] = resumed.fetched_at
+                self.resumed_count += 1
+            return resumed.sheet
+        if self.is_current(team, previous, self.max_reuse_age_seconds):
+            with self.lock:
+                self.fetched_at[team] = previous.fetched_at
+                self.reused_count += 1
+            return previous.sheet
+        return None
+
+    def fetched(self, key):
+        if key[0] == 'team':
+            with self.lock:
+                self.fetched_at[key[1]] = time.time()
+
+    def get(self, key, fetch):
+        future, owner = self.claim(key)
+        if owner:
+            try:
+                result = self.reuse(key)
+                if result is None:
+                    result = fetch()
+                    self.fetched(key)
+                future.set_result(result)
+            except BaseException as e:
+                self.fail(key, future, e)
+        return future.result()
+
+    def results(self):
+        """Returns {key: result} for everything fetched successfully so far."""
+        with self.lock:
+            items = list(self.futures.items())
+        return {key: future.result() for key, future in items if future.done() and future.exception() is None}
+
+    def net_rows_by_team(self):
+        return {row.team: row for row in self.results().get('net_nitty', ())}
+
+    def team_sheets(self):
+        """Returns {team: TeamSheet} for every team sheet fetched so far."""
+        return {key[1]: sheet for key, sheet in self.results().items() if key[0] == 'team'}
+
+    def game_logs(self):
+        """Returns {team: games} for every team sheet fetched so far."""
+        return {team: sheet.games for team, sheet in self.team_sheets().items()}
+
+    async def get_async(self, key, fetch):
+        """get for the asyncio engine. fetch returns an awaitable."""
+        future, owner = self.claim(key)
+        if owner:
+            try:
+                result = self.reuse(key)
+                if result is None:
+                    result = await fetch()
+                    self.fetched(key)
+                future.set_result(result)
+            except BaseException as e:
+                self.fail(key, future, e)
+        return await asyncio.wrap_future(future)
+
+
+def net_row_key(row):
+    """The parts of a NET nitty row that change when a team plays a game."""
+    return [row.net, row.overall_record, row.q1_record, row.q2_record, row.q3_record, row.q4_record]
+
+
+StoredTeamSheet = namedtuple('StoredTeamSheet', ['row_key', 'fetched_at', 'sheet'])
+
+
+class SnapshotStore:
+    """SQLite database of every scrape; latest() feeds the next ScrapeSnapshot."""
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS snapshots (
+            id INTEGER PRIMARY KEY,
+            season INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            UNIQUE (season, created_at)
+        );
+        CREATE TABLE IF NOT EXISTS net_rows (
+            snapshot_id INTEGER NOT NULL REFERENCES snapshots (id) ON DELETE CASCADE,
+            team TEXT NOT NULL,
+            row TEXT NOT NULL,
+            PRIMARY KEY (snapshot_id, team)
+        );
+        CREATE TABLE IF NOT EXISTS team_sheets (
+            snapshot_id INTEGER NOT NULL REFERENCES snapshots (id) ON DELETE CASCADE,
+            team TEXT NOT NULL,
+            row_key TEXT NOT NULL,
+            fetched_at REAL NOT NULL,
+            sheet TEXT NOT NULL,
+            PRIMARY KEY (snapshot_id, team)
+        );
+    '''
+
+    def __init__(self, path, keep_snapshots):
+        self.path = str(path)
+        self.keep_snapshots = keep_snapshots
+        self.lock = threading.Lock()
+        with closing(self.connect()) as conn:
+            conn.executescript(self.SCHEMA)
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA foreign_keys = ON')
+        return conn
+
+    def latest(self, season):
+        """Returns {team: StoredTeamSheet} with the newest saved sheet of every team in season."""
+        newest = {}
+        with self.lock, closing(self.connect()) as conn:
+            rows = conn.execute(
+                '''SELECT team_sheets.team, team_sheets.row_key, team_sheets.fetched_at, team_sheets.sheet
+                   FROM team_sheets JOIN snapshots ON snapshots.id = team_sheets.snapshot_id
+                   WHERE snapshots.season = ?
+                   ORDER BY snapshots.created_at''', (season,))
+            for team, row_key, fetched_at, sheet in rows:
+                newest[team] = (row_key, fetched_at, sheet)
+        return {
+            team: StoredTeamSheet(json.loads(row_key), fetched_at, decode_team_sheet(sheet))
+            for team, (row_key, fetched_at, sheet) in newest.items()
+        }
+
+    def save(self, snapshot):
+        """Writes everything snapshot has fetched so far. Saving the same snapshot again adds what is new."""
+        net_rows = snapshot.net_rows_by_team()
+        team_sheets = snapshot.team_sheets()
+        with self.lock, closing(self.connect()) as conn, conn:
+            conn.execute('INSERT OR IGNORE INTO snapshots (season, created_at) VALUES (?, ?)',
+                         (snapshot.season, snapshot.created_at))
+            snapshot_id = conn.execute('SELECT id FROM snapshots WHERE season = ? AND created_at = ?',
+                                       (snapshot.season, snapshot.created_at)).fetchone()[0]
+            conn.executemany('INSERT OR REPLACE INTO net_rows VALUES (?, ?, ?)',
+                             [(snapshot_id, team, json.dumps(list(row))) for team, row in net_rows.items()])
+            conn.executemany('INSERT OR REPLACE INTO team_sheets VALUES (?, ?, ?, ?, ?)', [
+                (snapshot_id, team, json.dumps(net_row_key(net_rows[team])), snapshot.fetched_at[team],
+                 encode_team_sheet(sheet))
+                for team, sheet in team_sheets.items()
+                if team in net_rows and team in snapshot.fetched_at
+            ])
+            conn.execute(
+                '''DELETE FROM snapshots WHERE season = ? AND id NOT IN (
+                       SELECT id FROM snapshots WHERE season = ? ORDER BY created_at DESC LIMIT ?)''',
+                (snapshot.season, snapshot.season, self.keep_snapshots))
+
+
+def encode_team_sheet(sheet):
+    return json.dumps(list(sheet))
+
+
+def decode_team_sheet(text):
+    fields = json.loads(text)
+    return TeamSheet(*fields[:-1], [GameResult(*game) for game in fields[-1]])
+
+
+scrape_snapshots = {}
+scrape_snapshots_lock = threading.Lock()
+snapshot_store = None
+snapshot_store_max_age_seconds = 0
+
+
+def configure_snapshot_store(store_config):
+    global snapshot_store, snapshot_store_max_age_seconds
+
+    if not store_config.get('ENABLED', False):
+        snapshot_store = None
+        return
+    store_path = store_config.get('PATH', DEFAULT_STORE_PATH)
+    keep_snapshots = int(store_config.get('KEEP_SNAPSHOTS', DEFAULT_STORE_KEEP_SNAPSHOTS))
+    snapshot_store_max_age_seconds = float(store_config.get('MAX_AGE_HOURS', DEFAULT_STORE_MAX_AGE_HOURS)) * 3600
+    if snapshot_store is None or snapshot_store.path != str(store_path):
+        snapshot_store = SnapshotStore(store_path, keep_snapshots)
+    else:
+        snapshot_store.keep_snapshots = keep_snapshots
+
+
+class Checkpoint:
+    """The team sheets one run has got so far, in a JSON lines file named after config.txt."""
+
+    def __init__(self, checkpoint_dir, season, config_hash):
+        self.path = Path(checkpoint_dir) / f'{season}-{config_hash[:16]}.jsonl'
+        self.lock = threading.Lock()
+        # team -> row_key already in the file
+        self.written = {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def load(self, max_age_seconds):
+        """Returns {team: StoredTeamSheet} for the sheets in the file younger than max_age_seconds."""
+        stored_sheets = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # the last line of a run that died while writing it
+                        continue
+                    self.written[entry['team']] = entry['row_key']
+                    if time.time() - entry['fetched_at'] < max_age_seconds:
+                        stored_sheets[entry['team']] = StoredTeamSheet(entry['row_key'], entry['fetched_at'],
+                                                                       decode_team_sheet(entry['sheet']))
+        except FileNotFoundError:
+            pass
+        return stored_sheets
+
+    def add(self, row, sheet, fetched_at):
+        row_key = net_row_key(row)
+        line = json.dumps({'team': row.team, 'row_key': row_key, 'fetched_at': fetched_at,
+                           'sheet': encode_team_sheet(sheet)})
+        with self.lock:
+            if self.written.get(row.team) == row_key:
+                return
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+            self.written[row.team] = row_key
+
+    def remove(self):
+        with self.lock:
+            self.path.unlink(missing_ok=True)
+            self.written.clear()
+
+
+current_checkpoint = contextvars.ContextVar('current_checkpoint', default=None)
+
+
+def open_checkpoint(checkpoint_config, season, config_text, snapshot):
+    """Returns the Checkpoint for this config.txt, or None, and resumes snapshot from it."""
+    if not checkpoint_config.get('ENABLED', False) or using_fixtures():
+        return None
+    checkpoint_dir = Path(checkpoint_config.get('DIRECTORY', DEFAULT_CHECKPOINT_DIR))
+    max_age_seconds = float(checkpoint_config.get('MAX_AGE_HOURS', DEFAULT_CHECKPOINT_MAX_AGE_HOURS)) * 3600
+    for path in checkpoint_dir.glob('*.jsonl'):
+        try:
+            if time.time() - path.stat().st_mtime >= max_age_seconds:
+                path.unlink()
+        except FileNotFoundError:
+            pass
+    checkpoint = Checkpoint(checkpoint_dir, season, hashlib.sha256(config_text.encode('utf-8')).hexdigest())
+    stored_sheets = checkpoint.load(max_age_seconds)
+    if stored_sheets:
+        to_log(f'Resuming from {checkpoint.path}: {len(stored_sheets)} team sheets from the last attempt')
+        snapshot.resume(stored_sheets)
+    return checkpoint
+
+
+def checkpoint_team_sheet(row, team_sheet, snapshot):
+    checkpoint = current_checkpoint.get()
+    if checkpoint is not None:
+        fetched_at = snapshot.fetched_at.get(row.team) if snapshot is not None else None
+        checkpoint.add(row, team_sheet, fetched_at or time.time())
+
+
+def get_scrape_snapshot(season, max_age_seconds):
+    """Returns the shared snapshot for season, or a new one when it is older than max_age_seconds."""
+    if using_fixtures():
+        return ScrapeSnapshot(season)
+    with scrape_snapshots_lock:
+        snapshot = scrape_snapshots.get(season)
+        if snapshot is None or time.time() - snapshot.created_at >= max_age_seconds:
+            previous = snapshot_store.latest(season) if snapshot_store is not None else None
+            snapshot = scrape_snapshots[season] = ScrapeSnapshot(season, previous, snapshot_store_max_age_seconds)
+        return snapshot
+
+
+ColumnPlan = namedtuple('ColumnPlan', ['name', 'keymap', 'width', 'left_align', 'two_digit_text_year'])
+
+
+def build_column_plan(visible_columns):
+    """Resolves COL_SETTINGS once for every visible column."""
+    column_plan = []
+    for col_name in visible_columns:
+        col_settings = COL_SETTINGS.get(col_name, {})
+        if not col_settings.get('keymap'):
+            to_log('!!! ERROR !!!')
+            to_log(f'No valid key mapping exists for {col_name}')
+        column_plan.append(ColumnPlan(col_name, col_settings.get('keymap'), col_settings.get('width'),
+                                      col_settings.get('left_align', False),
+                                      col_settings.get('two_digit_text_year', False)))
+    return column_plan
+
+
+OUTPUT_FORMATS = ('xlsx', 'csv', 'jsonl', 'parquet')
+DEFAULT_OUTPUT_CACHE_MB = 256
+
+
+class OutputCache:
+    """In-memory LRU of output files, keyed by what store() returns."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def store(self, name, data):
+        key = f'{uuid.uuid4().hex[:12]}/{name}'
+        with self.lock:
+            self.entries[key] = data
+            self.size += len(data)
+            # the file just stored is never dropped, even if it alone is too big
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                old_key, old_data = self.entries.popitem(last=False)
+                self.size -= len(old_data)
+        return key
+
+    def get(self, key):
+        """Returns the bytes stored under key, or None if they were dropped."""
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+            return data
+
+    def discard(self, keys):
+        with self.lock:
+            for key in keys:
+                data = self.entries.pop(key, None)
+                if data is not None:
+                    self.size -= len(data)
+
+
+output_cache = OutputCache(float(os.environ.get('WARRENNOLAN_OUTPUT_CACHE_MB', DEFAULT_OUTPUT_CACHE_MB)) * 1024 * 1024)
+
+
+def output_name(key):
+    """The file name part of an output_cache key."""
+    return key.split('/', 1)[1]
+
+
+def save_output(name, output_dir, write):
+    """Writes the output into output_dir and returns the path, or into output_cache and returns the key."""
+    if output_dir is None:
+        to_log(f'Generating {name} in memory')
+        buffer = io.BytesIO()
+        write(buffer)
+        return output_cache.store(name, buffer.getvalue())
+
+    fname = os.path.join(output_dir, name)
+    to_log(f'Generating file at {os.path.abspath(fname)}')
+    write(fname)
+    return fname
+
+
+@contextmanager
+def open_text_target(target):
+    """Opens target, a path or a binary file object, for writing UTF-8 text."""
+    if isinstance(target, (str, os.PathLike)):
+        with open(target, 'w', newline='', encoding='utf-8') as f:
+            yield f
+    else:
+        f = io.TextIOWrapper(target, encoding='utf-8', newline='')
+        try:
+            yield f
+        finally:
+            f.flush()
+            # leave target open for the caller
+            f.detach()
+
+
+def check_choice(name, value, choices):
+    if value not in choices:
+        raise ValueError(f'Unknown {name} {value}, pick one of {", ".join(choices)}')
+
+
+def available_output_formats():
+    """OUTPUT_FORMATS that can be written here: parquet only when pyarrow is installed."""
+    return [output_format for output_format in OUTPUT_FORMATS
+            if output_format != 'parquet' or importlib.util.find_spec('pyarrow') is not None]
+
+
+def check_output_format(output_format):
+    """Raises before any scraping starts if output_format can't be written."""
+    check_choice('OUTPUT_FORMAT', output_format, OUTPUT_FORMATS)
+    # pyarrow is only needed for parquet, so it is not in requirements.txt
+    if output_format == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        raise RuntimeError('OUTPUT_FORMAT parquet needs pyarrow: pip install pyarrow')
+
+
+def generate_output_file(sorted_input, jordan_formula, visible_columns, select_mode, output_dir='.',
+                         output_format='xlsx'):
+    """Writes the output to output_dir, or to output_cache when output_dir is None. See save_output."""
     now_et = datetime.now(pytz.timezone('America/New_York'))
     today_str = now_et.strftime('%Y-%m-%d %H%M')
     eo_name = "selected" if select_mode else "sorted"
-    fname = f"warrennolan_nitty_{'formula' if jordan_formula else 'net'}_{eo_name}_{today_str}.xlsx"
-    to_log(f'Generating file at {os.getcwd()}\\{fname}')
-    with xlsxwriter.Workbook(fname) as workbook:
+    check_output_format(output_format)
+    name = f"warrennolan_nitty_{'formula' if jordan_formula else 'net'}_{eo_name}_{today_str}.{output_format}"
+    column_plan = build_column_plan(visible_columns)
+
+    def write(target):
+        if output_format == 'xlsx':
+            write_xlsx_output(target, sorted_input, column_plan)
+            return
+        header, rows = [column.name for column in column_plan], table_rows(sorted_input, column_plan)
+        if output_format == 'csv':
+            write_csv_output(target, header, rows)
+        elif output_format == 'jsonl':
+            write_jsonl_output(target, header, rows)
+        else:
+            write_parquet_output(target, header, list(rows))
+
+    with timer('warrennolan_output_seconds', format=output_format):
+        return save_output(name, output_dir, write)
+
+
+def write_xlsx_output(target, sorted_input, column_plan):
+    # constant_memory writes each row to a temp file as soon as the next one
+    # starts, so rows have to be written top to bottom
+    with xlsxwriter.Workbook(target, {'constant_memory': True}) as workbook:
         worksheet = workbook.add_worksheet()
         blue_cell_format = workbook.add_format({
             'bg_color': 'blue',
@@ -527,62 +2088,92 @@ def generate_output_file(sorted_input, jordan_formula, visible_columns, select_m
         })
         center_align_format = workbook.add_format({'align': 'center'})
 
+        for col_num, column in enumerate(column_plan):
+            if column.width is not None:
+                worksheet.set_column(col_num, col_num, column.width,
+                                     center_align_format if not column.left_align else None)
+
         # write header row
-        worksheet.write_row(0, 0, visible_columns)
         worksheet.set_row(0, None, center_align_format)
+        worksheet.write_row(0, 0, [column.name for column in column_plan])
 
-        for row_num, team_dict in enumerate(sorted_input):
-            for col_num, col_name in enumerate(visible_columns):
-                col_format = blue_cell_format if col_name == 'NET' and team_dict[
-                    'conf_leader'] else {}
-                col_key = COL_SETTINGS.get(col_name, {
-                    'keymap': None
-                }).get('keymap', None)
-                if col_key:
-                    worksheet.write(row_num + 1, col_num, team_dict[col_key],
-                                    col_format)
-                else:
-                    to_log('!!! ERROR !!!')
-                    to_log(f'No valid key mapping exists for {col_name}')
-
-        col_prefix, col_suffix = '', 'A'
-        cols_to_ignore_two_digit_text_year = []
-        for col_name in visible_columns:
-            col_letter = col_prefix + col_suffix
-            left_align = COL_SETTINGS[col_name].get('left_align', False)
-            worksheet.set_column(
-                f'{col_letter}:{col_letter}', COL_SETTINGS[col_name]['width'],
-                center_align_format if not left_align else None)
-            if COL_SETTINGS[col_name].get('two_digit_text_year', False):
-                cols_to_ignore_two_digit_text_year.append(col_letter)
-            if col_suffix == 'Z':
-                col_prefix, col_suffix = 'A', 'A'
-            else:
-                col_suffix = chr(ord(col_suffix) + 1)
+        row_count = 0
+        for row_num, team_dict in enumerate(sorted_input, start=1):
+            for col_num, column in enumerate(column_plan):
+                if column.keymap:
+                    col_format = blue_cell_format if column.name == 'NET' and team_dict['conf_leader'] else None
+                    worksheet.write(row_num, col_num, team_dict[column.keymap], col_format)
+            row_count = row_num
 
         worksheet.freeze_panes(1, 2)
-        two_digit_str_list = [
-            f'{col_name}2:{col_name}1000'
-            for col_name in cols_to_ignore_two_digit_text_year
-        ]
-        two_digit_str = ' '.join(two_digit_str_list)
-        worksheet.ignore_errors({'two_digit_text_year': two_digit_str})
+        if row_count:
+            two_digit_str = ' '.join(
+                f'{xl_col_to_name(col_num)}2:{xl_col_to_name(col_num)}{row_count + 1}'
+                for col_num, column in enumerate(column_plan)
+                if column.two_digit_text_year
+            )
+            if two_digit_str:
+                worksheet.ignore_errors({'two_digit_text_year': two_digit_str})
 
-    return fname
+
+def table_rows(sorted_input, column_plan):
+    """Yields one list of values per team for the plain table formats."""
+    keymaps = ['team_page_url' if column.keymap == 'team_url' else column.keymap for column in column_plan]
+    for team_dict in sorted_input:
+        yield [team_dict[keymap] if keymap else None for keymap in keymaps]
+
+
+def write_csv_output(target, header, rows):
+    with open_text_target(target) as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def write_jsonl_output(target, header, rows):
+    with open_text_target(target) as f:
+        for row in rows:
+            f.write(json.dumps(dict(zip(header, row))) + '\n')
+
+
+def write_parquet_output(target, header, rows):
+    import pyarrow
+    import pyarrow.parquet
+
+    columns = list(zip(*rows)) if rows else [()] * len(header)
+    pyarrow.parquet.write_table(pyarrow.table(dict(zip(header, map(list, columns)))), target)
 
 
 def get_net_nitty_raw_data():
-    page = requests.get(MEN_URL)
-    soup = BeautifulSoup(page.content, 'html.parser')
-    tables = soup.find_all("table")
-    if len(tables) > 1:
-        del tables[1:]
-    table = tables[0]
-    del page
-    del soup
-    return [[(cell.text, cell.attrs.get('style', ''))
-             for cell in row.find_all(["th", "td"])]
-            for row in table.find_all("tr")]
+    page = http_get(MEN_URL, stream=True)
+
+    def counted_chunks():
+        for chunk in page.iter_content(NET_NITTY_CHUNK_SIZE):
+            count('warrennolan_fetch_bytes_total', len(chunk))
+            yield chunk
+
+    try:
+        # the page is parsed while it streams in, so this includes reading it
+        with timer('warrennolan_parse_seconds', page='net_nitty'):
+            return parse_net_nitty_page(counted_chunks())
+    finally:
+        page.close()
+
+
+def parse_net_nitty_page(chunks):
+    """Returns a NetNittyRow for every team in the first table of the NET nitty page."""
+    if isinstance(chunks, bytes):
+        chunks = [chunks]
+    target = NetNittyTableTarget()
+    parser = None
+    for chunk in chunks:
+        if parser is None:
+            encoding = EncodingDetector.find_declared_encoding(chunk, is_html=True) or 'utf-8'
+            parser = etree.HTMLParser(target=target, encoding=encoding)
+        parser.feed(chunk)
+        if target.done:
+            break
+    return parser.close() if parser is not None else []
 
 
 def cleanse_team_data(row):
@@ -597,8 +2188,7 @@ def cleanse_team_data(row):
                 ineligible = True
         if cell in ['\n', '\n\n']:
             continue
-        while cell[0] == '\n':
-            cell = cell[1:]
+        cell = cell.lstrip('\n')
         if idx == 1:
             cell_split = cell.split('\n')
             open_parenthesis_idx = cell_split[1].find('(')
@@ -612,170 +2202,641 @@ def cleanse_team_data(row):
         else:
             cleansed_row.append(cell.strip())
 
-    return cleansed_row, conf_leader, ineligible
+    return NetNittyRow(*cleansed_row, conf_leader, ineligible)
+
+
+def wants_team_stats(row, ineligible_teams, select_mode, select_teams, fetch_filter=None):
+    if row.ineligible or row.team in ineligible_teams or (select_mode and row.team not in select_teams):
+        to_log(f'   Skipping {row.team} due to ineligibility and/or not being SELECTED')
+        return False
+    skip_reason = fetch_filter(row) if fetch_filter is not None else None
+    if skip_reason:
+        to_log(f'   Skipping {row.team} due to {skip_reason}')
+        return False
+    return True
 
 
-def create_team_data_obj(cleansed_team_data, conf_leader, at_large_teams,
-                         ineligible_teams, ineligible, select_mode, select_teams):
+def create_team_data_obj(row, at_large_teams, ineligible_teams, select_mode, select_teams, snapshot=None,
+                         fetch_filter=None):
     team_data_obj = None
-    net, team, conf, conf_record, overall_record, sos, nc_record, nc_sos, home_record, road_record, neutral_record, q1_record, q2_record, q3_record, q4_record, avg_net_wins, avg_net_losses = cleansed_team_data
-
-    if not ineligible and team not in ineligible_teams and (not select_mode or team in select_teams):
-        to_log('   Getting {team} Stats'.format(team=team))
-        team_url, kpi, sor, wab, bpi, pom, t_rank, high_q1_record, high_q1_wins, high_q1_losses, high_q1_rn_record, high_q1_rn_wins, high_q1_rn_losses, al_record, al_wins, al_losses = get_team_stats(
-            team, at_large_teams)
-        home_wins, home_losses = record_to_wins_and_losses(home_record)
-        road_wins, road_losses = record_to_wins_and_losses(road_record)
-        neutral_wins, neutral_losses = record_to_wins_and_losses(
-            neutral_record)
-        q1_wins, q1_losses = record_to_wins_and_losses(q1_record)
-        q2_wins, q2_losses = record_to_wins_and_losses(q2_record)
-        q3_wins, q3_losses = record_to_wins_and_losses(q3_record)
-        q4_wins, q4_losses = record_to_wins_and_losses(q4_record)
-        road_neutral_wins = road_wins + neutral_wins
-        road_neutral_losses = road_losses + neutral_losses
-        combined_road_neutral_record = '%i-%i' % (road_neutral_wins,
-                                                  road_neutral_losses)
-        q1_q2_wins = q1_wins + q2_wins
-        q1_q2_losses = q1_losses + q2_losses
-        combined_q1_q2_record = '%i-%i' % (q1_wins + q2_wins,
-                                           q1_losses + q2_losses)
-        combined_q3_q4_losses = q3_losses + q4_losses
-        team_data_obj = {
-            'team': team,
-            'team_url': team_url,
-            'net': int(net.split(' ')[0]),
-            'conf': conf,
-            'conf_record': conf_record,
-            'overall_record': overall_record,
-            'kpi': int(kpi) if kpi else 1000,
-            'sor': int(sor) if sor else 1000,
-            'wab': int(wab) if wab else 1000,
-            'bpi': int(bpi) if bpi else 1000,
-            'pom': int(pom) if pom else 1000,
-            't_rank': int(t_rank) if t_rank else 1000,
-            'nc_record': nc_record,
-            'nc_sos': int(nc_sos) if nc_sos else 1000,
-            'home_record': home_record,
-            'home_wins': home_wins,
-            'home_losses': home_losses,
-            'road_record': road_record,
-            'road_wins': road_wins,
-            'road_losses': road_losses,
-            'neutral_record': neutral_record,
-            'neutral_wins': neutral_wins,
-            'neutral_losses': neutral_losses,
-            'road_neutral_wins': road_neutral_wins,
-            'road_neutral_losses': road_neutral_losses,
-            'combined_road_neutral_record': combined_road_neutral_record,
-            'q1_q2_wins': q1_q2_wins,
-            'q1_q2_losses': q1_q2_losses,
-            'combined_q1_q2_record': combined_q1_q2_record,
-            'combined_q3_q4_losses': combined_q3_q4_losses,
-            'q1_record': q1_record,
-            'q1_wins': q1_wins,
-            'q1_losses': q1_losses,
-            'q2_record': q2_record,
-            'q2_wins': q2_wins,
-            'q2_losses': q2_losses,
-            'q3_record': q3_record,
-            'q3_wins': q3_wins,
-            'q3_losses': q3_losses,
-            'q4_record': q4_record,
-            'q4_wins': q4_wins,
-            'q4_losses': q4_losses,
-            'high_q1_record': high_q1_record,
-            'high_q1_wins': high_q1_wins,
-            'high_q1_losses': high_q1_losses,
-            'high_q1_rn_record': high_q1_rn_record,
-            'high_q1_rn_wins': high_q1_rn_wins,
-            'high_q1_rn_losses': high_q1_rn_losses,
-            'al_record': al_record,
-            'al_wins': al_wins,
-            'al_losses': al_losses,
-            'avg_net_wins': avg_net_wins,
-            'avg_net_losses': avg_net_losses,
-            'conf_leader': conf_leader
-        }
-    else:
-        to_log(f'   Skipping {team} due to ineligibility and/or not being SELECTED')
+
+    if wants_team_stats(row, ineligible_teams, select_mode, select_teams, fetch_filter):
+        to_log('   Getting {team} Stats'.format(team=row.team))
+        team_sheet = get_team_sheet(row.team, snapshot)
+        checkpoint_team_sheet(row, team_sheet, snapshot)
+        team_data_obj = build_team_data_obj(row, team_stats_from_sheet(team_sheet, at_large_teams))
 
     return team_data_obj
 
 
-def extract_team_data(row, at_large_teams, ineligible_teams, select_mode, select_teams):
-    team_data_obj = None
-    if not row[0][0].startswith('NET\n'):
-        cleansed_team_data, conf_leader, ineligible = cleanse_team_data(row)
-        del row
-        team_data_obj = create_team_data_obj(cleansed_team_data, conf_leader,
-                                             at_large_teams, ineligible_teams,
-                                             ineligible, select_mode, select_teams)
-        del cleansed_team_data
+def record_properties(record_name):
+    """Returns (wins, losses) properties parsed on access from the 'W-L' string attribute record_name."""
+    return (property(lambda self: record_to_wins_and_losses(getattr(self, record_name))[0]),
+            property(lambda self: record_to_wins_and_losses(getattr(self, record_name))[1]))
 
-    return team_data_obj
 
+class TeamRecord:
+    """One team's row of the output. Derived records are computed on access."""
+    __slots__ = (
+        'team', 'team_url', 'net', 'conf', 'conf_record', 'overall_record', 'kpi', 'sor', 'wab', 'bpi', 'pom',
+        't_rank', 'nc_record', 'nc_sos', 'home_record', 'road_record', 'neutral_record', 'q1_record', 'q2_record',
+        'q3_record', 'q4_record', 'high_q1_wins', 'high_q1_losses', 'high_q1_rn_wins', 'high_q1_rn_losses',
+        'al_wins', 'al_losses', 'avg_net_wins', 'avg_net_losses', 'conf_leader', '_values'
+    )
 
-def splice_in_team_dict(team_dict, out_list, team_dict_idx):
-    if team_dict_idx == 0:
-        out_list = [team_dict] + out_list
-    elif team_dict_idx == len(out_list):
-        out_list.append(team_dict)
-    else:
-        out_list = out_list[:team_dict_idx] + [team_dict
-                                               ] + out_list[team_dict_idx:]
+    def __init__(self, **fields):
+        for name in self.__slots__[:-1]:
+            setattr(self, name, fields[name])
+        self._values = None
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __eq__(self, other):
+        if not isinstance(other, TeamRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__[:-1])
+
+    def __repr__(self):
+        return f'TeamRecord({self.team!r}, net={self.net})'
+
+    def replace(self, **changes):
+        """Returns a copy with the given fields changed."""
+        fields = {name: getattr(self, name) for name in self.__slots__[:-1]}
+        fields.update(changes)
+        return TeamRecord(**fields)
+
+    @property
+    def values(self):
+        if self._values is None:
+            self._values = tuple(int(getattr(self, key)) for key in TEAM_VALUE_KEYS)
+        return self._values
+
+    home_wins, home_losses = record_properties('home_record')
+    road_wins, road_losses = record_properties('road_record')
+    neutral_wins, neutral_losses = record_properties('neutral_record')
+    q1_wins, q1_losses = record_properties('q1_record')
+    q2_wins, q2_losses = record_properties('q2_record')
+    q3_wins, q3_losses = record_properties('q3_record')
+    q4_wins, q4_losses = record_properties('q4_record')
+
+    @property
+    def road_neutral_wins(self):
+        return self.road_wins + self.neutral_wins
+
+    @property
+    def road_neutral_losses(self):
+        return self.road_losses + self.neutral_losses
+
+    @property
+    def combined_road_neutral_record(self):
+        return '%i-%i' % (self.road_neutral_wins, self.road_neutral_losses)
+
+    @property
+    def q1_q2_wins(self):
+        return self.q1_wins + self.q2_wins
+
+    @property
+    def q1_q2_losses(self):
+        return self.q1_losses + self.q2_losses
+
+    @property
+    def combined_q1_q2_record(self):
+        return '%i-%i' % (self.q1_q2_wins, self.q1_q2_losses)
+
+    @property
+    def combined_q3_q4_losses(self):
+        return self.q3_losses + self.q4_losses
+
+    @property
+    def high_q1_record(self):
+        return '%s-%s' % (str(self.high_q1_wins), str(self.high_q1_losses))
+
+    @property
+    def high_q1_rn_record(self):
+        return '%s-%s' % (str(self.high_q1_rn_wins), str(self.high_q1_rn_losses))
+
+    @property
+    def al_record(self):
+        return '%s-%s' % (str(self.al_wins), str(self.al_losses))
+
+    @property
+    def team_page_url(self):
+        """The plain team sheet URL; team_url is the Excel HYPERLINK formula."""
+        return get_team_url(self.team)[1]
+
+
+def build_team_data_obj(row, team_stats):
+    net, team, conf, conf_record, overall_record, sos, nc_record, nc_sos, home_record, road_record, neutral_record, q1_record, q2_record, q3_record, q4_record, avg_net_wins, avg_net_losses, conf_leader, ineligible = row
+    team_url, kpi, sor, wab, bpi, pom, t_rank, high_q1_record, high_q1_wins, high_q1_losses, high_q1_rn_record, high_q1_rn_wins, high_q1_rn_losses, al_record, al_wins, al_losses = team_stats
+
+    return TeamRecord(
+        team=team,
+        team_url=team_url,
+        net=int(net.split(' ')[0]),
+        conf=conf,
+        conf_record=conf_record,
+        overall_record=overall_record,
+        kpi=int(kpi) if kpi else 1000,
+        sor=int(sor) if sor else 1000,
+        wab=int(wab) if wab else 1000,
+        bpi=int(bpi) if bpi else 1000,
+        pom=int(pom) if pom else 1000,
+        t_rank=int(t_rank) if t_rank else 1000,
+        nc_record=nc_record,
+        nc_sos=int(nc_sos) if nc_sos else 1000,
+        home_record=home_record,
+        road_record=road_record,
+        neutral_record=neutral_record,
+        q1_record=q1_record,
+        q2_record=q2_record,
+        q3_record=q3_record,
+        q4_record=q4_record,
+        high_q1_wins=high_q1_wins,
+        high_q1_losses=high_q1_losses,
+        high_q1_rn_wins=high_q1_rn_wins,
+        high_q1_rn_losses=high_q1_rn_losses,
+        al_wins=al_wins,
+        al_losses=al_losses,
+        avg_net_wins=avg_net_wins,
+        avg_net_losses=avg_net_losses,
+        conf_leader=conf_leader
+    )
+
+
+def meets_sort_threshold(overall_record, conf_leader):
+    # only consider teams at least 2 games over .500, or conference leaders
+    overall_wins, overall_losses = record_to_wins_and_losses(overall_record)
+    return overall_wins - overall_losses >= 2 or conf_leader
+
+
+def make_team_comparator(formula, select_mode):
+    """compare_teams with the formula's index lists worked out once."""
+    idx_lists = formula_idx_lists(formula, select_mode)
+
+    def team_comparator(x, y):
+        return compare_teams(x, y, formula, select_mode, idx_lists)
+
+    return team_comparator
+
+
+# insertion is the ranking the formula has always produced; merge ranks differently
+DEFAULT_SORT_MODE = 'insertion'
+SORT_MODES = ('insertion', 'merge')
+SCORING_ENGINES = ('numpy', 'python')
+
+
+def check_formula_modes(formula):
+    """Raises before any scraping starts on a SORT_MODE or SCORING_ENGINE the sort doesn't know."""
+    check_choice('SORT_MODE', formula.get('SORT_MODE', DEFAULT_SORT_MODE), SORT_MODES)
+    check_choice('SCORING_ENGINE', formula.get('SCORING_ENGINE', 'numpy'), SCORING_ENGINES)
+
+
+def insertion_sort_teams(in_list, team_comparator, log=True, net_list=None):
+    """
+    Places each team, in NET order, just below the lowest placed team that beats it. net_list
+    only adds the filtered out teams to the log.
+    """
+    net_teams = iter(in_list if net_list is None else net_list)
+    out_list = []
+    for team_dict in in_list:
+        if log:
+            for net_team in net_teams:
+                to_log(' Placing %s' % net_team['team'])
+                if net_team is team_dict:
+                    break
+                log_filtered_out(net_team)
+        team_dict_idx = 0
+        for out_list_idx in range(len(out_list) - 1, -1, -1):
+            if team_comparator(team_dict, out_list[out_list_idx]) > 0:
+                # out_list[out_list_idx] is better. team_dict should go just below them
+                team_dict_idx = out_list_idx + 1
+                break
+        out_list.insert(team_dict_idx, team_dict)
+
+    if log:
+        for net_team in net_teams:
+            to_log(' Placing %s' % net_team['team'])
+            log_filtered_out(net_team)
 
     return out_list
 
 
+def make_fetch_filter(formula):
+    """Returns the check that skips a team's sheet before it is fetched, see MAX_NET_RANK."""
+    max_net_rank = int(formula.get('MAX_NET_RANK', 0) or 0)
+
+    def fetch_filter(row):
+        if not meets_sort_threshold(row.overall_record, row.conf_leader):
+            return f'{row.overall_record} overall record'
+        net_rank = int(row.net.split(' ')[0])
+        if max_net_rank and net_rank > max_net_rank and not row.conf_leader:
+            return f'NET rank {net_rank} below MAX_NET_RANK {max_net_rank}'
+        return None
+
+    return fetch_filter
+
+
+def filter_sortable_teams(in_list):
+    return [team_dict for team_dict in in_list
+            if meets_sort_threshold(team_dict['overall_record'], team_dict['conf_leader'])]
+
+
+def log_filtered_out(team_dict):
+    to_log('%s filtered out due to %s overall record' % (team_dict['team'], team_dict['overall_record']))
+
+
+def order_teams(eligible_list, formula, select_mode, features=None, log=True, net_list=None):
+    """Orders teams that already passed filter_sortable_teams."""
+    use_numpy = formula.get('SCORING_ENGINE', 'numpy') == 'numpy' and not (log and trace_enabled())
+    engine = 'numpy' if use_numpy else 'python'
+    start = time.perf_counter()
+    if engine == 'numpy':
+        if features is None:
+            features = build_team_features(eligible_list)
+        results = comparison_matrix(features, formula, select_mode)
+        team_comparator = make_matrix_comparator(eligible_list, results)
+    else:
+        team_comparator = make_team_comparator(formula, select_mode)
+    comparisons = itertools.count()
+
+    def counted_comparator(x, y):
+        next(comparisons)
+        return team_comparator(x, y)
+
+    if formula.get('SORT_MODE', DEFAULT_SORT_MODE) == 'insertion':
+        sorted_list = insertion_sort_teams(eligible_list, counted_comparator, log, net_list)
+    else:
+        if log:
+            eligible_ids = {id(team_dict) for team_dict in eligible_list}
+            for team_dict in net_list or ():
+                if id(team_dict) not in eligible_ids:
+                    log_filtered_out(team_dict)
+            to_log(' Sorting %i teams' % len(eligible_list))
+        sorted_list = sorted(eligible_list, key=cmp_to_key(counted_comparator))
+    observe('warrennolan_sort_seconds', time.perf_counter() - start, engine=engine)
+    count('warrennolan_comparisons_total', next(comparisons), engine=engine)
+    return sorted_list
+
+
 def sort_teams(in_list, formula, select_mode):
-    out_list = []
-    log_bottom_list = []
-    for idx, team_dict in enumerate(in_list):
-        team_name = team_dict['team']
-        to_log(' Placing %s' % team_name)
-        overall_wins, overall_losses = record_to_wins_and_losses(
-            team_dict['overall_record'])
-        if overall_wins - overall_losses < 2 and not team_dict['conf_leader']:
-            # only consider teams at least 2 games over .500, or conference leaders
-            to_log('%s filtered out due to %s overall record' %
-                   (team_name, team_dict['overall_record']))
-        else:
-            net_rank = idx + 1
-            if net_rank == 1:
-                out_list.append(team_dict)
-            else:
-                team_dict_idx = 0
-                for out_list_idx, team_to_cmp in enumerate(out_list[::-1]):
-                    out_list_idx = len(out_list) - 1 - out_list_idx
-                    if compare_teams(team_dict, team_to_cmp, formula, select_mode) > 0:
-                        # team_to_cmp is better. team_dict should go just below them
-                        team_dict_idx = out_list_idx + 1
-                        break
+    """Orders the teams by the formula, see SORT_MODE in config.txt."""
+    return order_teams(filter_sortable_teams(in_list), formula, select_mode, net_list=in_list)
+
+
+def scrape_team_stats(net_nitty_rows, at_large_teams, ineligible_teams, select_mode, select_teams, team_dict_list,
+                      max_workers=1, snapshot=None, fetch_filter=None):
+    """Long-running scraping task. team_dict_list stays in NET order."""
+    def extract(row):
+        return create_team_data_obj(row, at_large_teams, ineligible_teams, select_mode, select_teams, snapshot,
+                                    fetch_filter)
+
+    rows = net_nitty_rows
+    if max_workers > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # each task runs in a copy of this thread's context so to_log still finds the current job
+            futures = [executor.submit(contextvars.copy_context().run, extract, row) for row in rows]
+            results = [future.result() for future in futures]
+    else:
+        results = map(extract, rows)
 
-                out_list = splice_in_team_dict(team_dict, out_list,
-                                               team_dict_idx)
+    for team_data in results:
+        if team_data:
+            team_dict_list.append(team_data)
 
-    for log_bottom_msg in log_bottom_list:
-        to_log(log_bottom_msg)
 
-    return out_list
+SCRAPE_ENGINES = ('threaded', 'asyncio')
 
 
-def scrape_team_stats(raw_table_data, at_large_teams, ineligible_teams, select_mode, select_teams, team_dict_list):
-    """Long-running scraping task."""
-    for row in raw_table_data[1:]:
-        team_data = extract_team_data(row, at_large_teams, ineligible_teams, select_mode, select_teams)
+async def async_http_get(session, url, headers=None):
+    """asyncio counterpart of http_get, with the same rate limit, concurrency limit and retries."""
+    store = fixture_store
+    if store is not None and store.mode == 'replay':
+        return store.replay(url)
+    concurrency = get_http_concurrency()
+    for attempt in itertools.count(1):
+        status = None
+        await concurrency.acquire_async()
+        start = time.perf_counter()
+        try:
+            rate_limit = http_rate_limit
+            if rate_limit is not None:
+                await asyncio.sleep(rate_limit.reserve())
+            start = time.perf_counter()
+            async with session.get(url, headers=headers) as page:
+                status, page_headers, body = page.status, page.headers, await page.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = e
+        finally:
+            # also on cancellation, which asyncio.gather does to the other fetches when one fails
+            latency = time.perf_counter() - start
+            concurrency.release(latency, ok=status is not None and status not in RETRY_STATUSES)
+        if status is None:
+            reason = 'timeout' if isinstance(error, asyncio.TimeoutError) else 'connection'
+            await asyncio.sleep(retry_or_raise(url, attempt, reason, error))
+            continue
+        observe('warrennolan_fetch_seconds', latency)
+        count('warrennolan_http_requests_total')
+        if status not in RETRY_STATUSES:
+            break
+        error = aiohttp.ClientResponseError(page.request_info, (), status=status, message=f'HTTP {status} from {url}')
+        await asyncio.sleep(retry_or_raise(url, attempt, str(status), error, page_headers.get('Retry-After')))
+    count('warrennolan_fetch_bytes_total', len(body))
+    if store is not None and status == 200:
+        store.save(url, status, page_headers, body)
+    return status, page_headers, body
+
+
+async def count_async_connection(session, trace_config_ctx, params):
+    count('warrennolan_http_connections_total')
+
+
+async def async_cached_http_get(session, url):
+    """asyncio counterpart of cached_http_get."""
+    cache = response_cache if not using_fixtures() else None
+    if cache is None:
+        return (await async_http_get(session, url))[2]
+
+    entry = cache.get(url)
+    if entry and cache.is_fresh(entry):
+        content = cache.read(url)
+        if content is not None:
+            return content
+
+    status, headers, content = await async_http_get(session, url, cache.conditional_headers(entry))
+    if status == 304 and entry:
+        cached_content = cache.read(url)
+        if cached_content is not None:
+            cache.revalidated(url, entry)
+            return cached_content
+        status, headers, content = await async_http_get(session, url)
+    if status == 200:
+        cache.store(url, content, headers)
+    return content
+
+
+async def scrape_team_stats_async(at_large_teams, ineligible_teams, select_mode, select_teams, team_dict_list,
+                                  concurrency, snapshot=None, fetch_filter=None):
+    """asyncio counterpart of get_net_nitty_raw_data + scrape_team_stats."""
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=http_timeout)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_create_end.append(count_async_connection)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout, trace_configs=[trace_config],
+                                     headers={'Accept-Encoding': 'gzip, deflate'}) as session:
+        snapshot = snapshot or ScrapeSnapshot(YEAR_INT)
+
+        async def fetch_net_nitty_rows():
+            content = (await async_http_get(session, MEN_URL))[2]
+            with timer('warrennolan_parse_seconds', page='net_nitty'):
+                return parse_net_nitty_page(content)
+
+        async def fetch_team_sheet_async(team):
+            team_slug, team_url = get_team_url(team)
+            async with semaphore:
+                content = await async_cached_http_get(session, team_url)
+            with timer('warrennolan_parse_seconds', page='team_sheet'):
+                return parse_team_sheet(content, team_slug, team_url)
+
+        net_nitty_rows = await snapshot.get_async('net_nitty', fetch_net_nitty_rows)
+
+        async def extract(row):
+            if not wants_team_stats(row, ineligible_teams, select_mode, select_teams, fetch_filter):
+                return None
+            to_log('   Getting {team} Stats'.format(team=row.team))
+            team_sheet = await snapshot.get_async(('team', row.team), lambda: fetch_team_sheet_async(row.team))
+            checkpoint_team_sheet(row, team_sheet, snapshot)
+            return build_team_data_obj(row, team_stats_from_sheet(team_sheet, at_large_teams))
+
+        # like the thread pool, let every other team finish (and reach the checkpoint) before failing
+        results = await asyncio.gather(*[extract(row) for row in net_nitty_rows], return_exceptions=True)
+
+    for team_data in results:
+        if isinstance(team_data, BaseException):
+            raise team_data
         if team_data:
             team_dict_list.append(team_data)
 
+    return net_nitty_rows
+
+
+DEFAULT_SWEEP_TOP_N = 68
+sweep_worker_state = {}
+
+
+def sweep_values(spec):
+    """A sweep range is {START, STOP, STEP} (STOP included), a list of values or a single value."""
+    if isinstance(spec, dict):
+        start, stop, step = spec['START'], spec['STOP'], spec.get('STEP', 1)
+        count = int(math.floor((stop - start) / step + 1e-9)) + 1
+        return [start + idx * step for idx in range(max(count, 0))]
+    if isinstance(spec, list):
+        return spec
+    return [spec]
+
+
+def formula_sweep_variants(ranges):
+    """Yields one dict of *_PTS overrides per combination of the sweep ranges."""
+    keys = list(ranges)
+    for values in itertools.product(*[sweep_values(ranges[key]) for key in keys]):
+        yield dict(zip(keys, values))
+
+
+def init_sweep_worker(features, base_formula, select_mode):
+    """Runs once per sweep process, so the team features are sent to each worker once."""
+    sweep_worker_state['features'] = features
+    sweep_worker_state['base_formula'] = base_formula
+    sweep_worker_state['select_mode'] = select_mode
+
+
+def order_team_indices(results, sort_mode):
+    """Orders team indices 0..n-1 from a comparison_matrix, like order_teams does with team dicts."""
+    def team_comparator(x_idx, y_idx):
+        return int(results[x_idx, y_idx])
+
+    team_indices = list(range(results.shape[0]))
+    if sort_mode == 'insertion':
+        return insertion_sort_teams(team_indices, team_comparator, log=False)
+    return sorted(team_indices, key=cmp_to_key(team_comparator))
+
+
+def run_sweep_chunk(formula_overrides_list, top_n):
+    """Ranks the teams under each formula variant and returns the running tallies for the chunk."""
+    features = sweep_worker_state['features']
+    team_count = len(features.net)
+    top_n_counts = np.zeros(team_count, dtype=np.int64)
+    rank_sums = np.zeros(team_count, dtype=np.int64)
+    best_ranks = np.full(team_count, team_count, dtype=np.int64)
+    worst_ranks = np.zeros(team_count, dtype=np.int64)
+    ranks = np.empty(team_count, dtype=np.int64)
+
+    for formula_overrides in formula_overrides_list:
+        formula = dict(sweep_worker_state['base_formula'], **formula_overrides)
+        results = comparison_matrix(features, formula, sweep_worker_state['select_mode'])
+        order = order_team_indices(results, formula.get('SORT_MODE', DEFAULT_SORT_MODE))
+        ranks[order] = np.arange(1, team_count + 1)
+        top_n_counts += ranks <= top_n
+        rank_sums += ranks
+        np.minimum(best_ranks, ranks, out=best_ranks)
+        np.maximum(worst_ranks, ranks, out=worst_ranks)
+
+    return top_n_counts, rank_sums, best_ranks, worst_ranks
+
+
+def run_formula_sweep(team_dict_list, base_formula, select_mode, sweep_config):
+    """Ranks the teams under every FORMULA_SWEEP combination on a process pool."""
+    top_n = sweep_config.get('TOP_N', DEFAULT_SWEEP_TOP_N)
+    workers = sweep_config.get('WORKERS', 0) or os.cpu_count() or 1
+    sortable_teams = filter_sortable_teams(team_dict_list)
+    features = build_team_features(sortable_teams)
+    variants = list(formula_sweep_variants(sweep_config.get('RANGES', {}) or {}))
+    to_log(f'Sweeping {len(variants)} formula variants over {len(sortable_teams)} teams with {workers} processes')
+
+    team_count = len(sortable_teams)
+    top_n_counts = np.zeros(team_count, dtype=np.int64)
+    rank_sums = np.zeros(team_count, dtype=np.int64)
+    best_ranks = np.full(team_count, team_count, dtype=np.int64)
+    worst_ranks = np.zeros(team_count, dtype=np.int64)
+
+    chunk_size = max(1, math.ceil(len(variants) / (workers * 4)))
+    chunks = [variants[idx:idx + chunk_size] for idx in range(0, len(variants), chunk_size)]
+    # The web server runs jobs on threads, and forking a threaded process can
+    # copy a lock some other thread is holding into the workers, so they are
+    # started from a clean forkserver process instead, or spawned where there
+    # is no forkserver (Windows).
+    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start_method),
+                             initializer=init_sweep_worker,
+                             initargs=(features, dict(base_formula, SCORING_ENGINE='numpy'), select_mode)) as executor:
+        for chunk_counts, chunk_rank_sums, chunk_best, chunk_worst in executor.map(run_sweep_chunk, chunks,
+                                                                                   itertools.repeat(top_n)):
+            top_n_counts += chunk_counts
+            rank_sums += chunk_rank_sums
+            np.minimum(best_ranks, chunk_best, out=best_ranks)
+            np.maximum(worst_ranks, chunk_worst, out=worst_ranks)
+
+    variant_count = max(len(variants), 1)
+    sweep_rows = [{
+        'team': team_dict['team'],
+        'net': team_dict['net'],
+        'top_n_pct': round(100.0 * int(top_n_counts[idx]) / variant_count, 1),
+        'avg_rank': round(int(rank_sums[idx]) / variant_count, 2),
+        'best_rank': int(best_ranks[idx]),
+        'worst_rank': int(worst_ranks[idx])
+    } for idx, team_dict in enumerate(sortable_teams)]
+    sweep_rows.sort(key=lambda row: (-row['top_n_pct'], row['avg_rank'], row['net']))
+    return sweep_rows, len(variants)
+
+
+def generate_sweep_file(sweep_rows, variant_count, top_n, output_dir='.'):
+    now_et = datetime.now(pytz.timezone('America/New_York'))
+    today_str = now_et.strftime('%Y-%m-%d %H%M')
+    columns = [('Team', 'team', 19), ('NET', 'net', 5), (f'Top {top_n} %', 'top_n_pct', 10),
+               ('Avg Rank', 'avg_rank', 9), ('Best Rank', 'best_rank', 9), ('Worst Rank', 'worst_rank', 10)]
+    return save_output(f"warrennolan_nitty_formula_sweep_{today_str}.xlsx", output_dir,
+                       lambda target: write_sweep_output(target, sweep_rows, variant_count, columns))
+
 
-def do_the_work():
-    config_file = 'config.txt'
+def write_sweep_output(target, sweep_rows, variant_count, columns):
+    with xlsxwriter.Workbook(target, {'constant_memory': True}) as workbook:
+        worksheet = workbook.add_worksheet()
+        center_align_format = workbook.add_format({'align': 'center'})
+        for col_num, (col_name, col_key, width) in enumerate(columns):
+            worksheet.set_column(col_num, col_num, width, center_align_format if col_num else None)
+        worksheet.set_row(0, None, center_align_format)
+        worksheet.write_row(0, 0, [col_name for col_name, col_key, width in columns])
+        for row_num, sweep_row in enumerate(sweep_rows):
+            worksheet.write_row(row_num + 1, 0, [sweep_row[col_key] for col_name, col_key, width in columns])
+        worksheet.freeze_panes(1, 1)
+        worksheet.write(len(sweep_rows) + 2, 0, f'{variant_count} formula variants')
+
+
+last_scrape = None
+
+
+def remember_scrape(team_dict_list, formula, select_mode, at_large_teams=(), game_logs=None):
+    """Keeps the latest scraped teams and their game logs in memory for what-if runs."""
+    global last_scrape
+
+    sortable_teams = filter_sortable_teams(team_dict_list)
+    last_scrape = {
+        'sortable_teams': sortable_teams,
+        'features': build_team_features(sortable_teams),
+        'formula': dict(formula),
+        'select_mode': select_mode,
+        'at_large': sorted(at_large_teams),
+        'game_logs': game_logs or {},
+        'scraped_at': datetime.now(pytz.timezone('America/New_York')).isoformat()
+    }
+
+
+def with_at_large_record(team_dict, games, at_large_teams):
+    """Returns a copy of team_dict with the AL record recomputed from its game log."""
+    al_wins, al_losses = at_large_record(games, at_large_teams)
+    return team_dict.replace(al_wins=al_wins, al_losses=al_losses)
+
+
+def invalid_formula_values(formula_overrides):
+    """Returns the *_PTS and *_THRESHOLD keys of formula_overrides whose values are not numbers."""
+    return sorted(key for key, value in formula_overrides.items()
+                  if key.endswith(('_PTS', '_THRESHOLD'))
+                  and (isinstance(value, bool) or not isinstance(value, (int, float))))
+
+
+def what_if_ranking(formula_overrides, at_large_teams=None):
+    """Re-sorts the last scraped teams with formula_overrides and, if given, a new AT_LARGE list."""
+    scrape = last_scrape
+    if scrape is None:
+        return None
+    formula = dict(scrape['formula'], **formula_overrides)
+    sortable_teams, features, at_large = scrape['sortable_teams'], scrape['features'], scrape['at_large']
+    if at_large_teams is not None:
+        at_large = sorted(set(at_large_teams))
+        game_logs = scrape['game_logs']
+        sortable_teams = [with_at_large_record(team_dict, game_logs.get(team_dict['team'], ()), at_large)
+                          for team_dict in sortable_teams]
+        features = build_team_features(sortable_teams)
+    if formula.get('SCORING_ENGINE', 'numpy') != 'numpy':
+        features = None
+    sorted_team_list = order_teams(sortable_teams, formula, scrape['select_mode'], features, log=False)
+    return {
+        'scraped_at': scrape['scraped_at'],
+        'select_mode': scrape['select_mode'],
+        'formula': formula,
+        'at_large': at_large,
+        'ranking': [{
+            'rank': rank,
+            'team': team_dict['team'],
+            'net': team_dict['net'],
+            'conf': team_dict['conf'],
+            'conf_leader': team_dict['conf_leader']
+        } for rank, team_dict in enumerate(sorted_team_list, start=1)]
+    }
+
+
+def keep_job_output(team_list, jordan_formula, visible_columns, select_mode, output_format):
+    """Lets the current job write its results again in another format for ?format= downloads."""
+    job = current_job.get()
+    if job is not None:
+        job.output_source = (team_list, jordan_formula, visible_columns, select_mode)
+        job.output_format = output_format
+
+
+def do_the_work(config_file='config.txt', output_dir='.', in_memory_output=False, config_text=None):
+    """Runs one config.txt, or config_text. Returns the output file (or output_cache key) and log paths."""
     fname = None
-    if os.path.exists(config_file):
-        with open(config_file, 'r') as f:
-            text = f.read()
+    log_fname = os.path.join(output_dir, LOG_FNAME)
+    file_dir = None if in_memory_output else output_dir
+    if config_text is not None or os.path.exists(config_file):
+        if config_text is None:
+            with open(config_file, 'r') as f:
+                config_text = f.read()
+        text = config_text
         # Replace non-breaking spaces with normal spaces
         # Remove problematic Unicode junk characters
         text = text.replace("\u00a0", " ")  # NBSP → normal space
@@ -788,112 +2849,278 @@ def do_the_work():
             to_log(f"YAML ERROR: {e}")
             raise
 
-        logging.basicConfig(level=logging.INFO,
-                            filename=LOG_FNAME,
-                            filemode='w',
-                            format='%(message)s')
-        team_dict_list = []
-        ineligible_teams = set(config.get('INELIGIBLE', []) or [])
-        at_large_teams = set(config.get('AT_LARGE', []) or [])
-        raw_table_data = get_net_nitty_raw_data()
-
-        use_jordan_formula = 'JORDAN_FORMULA' in config and config['JORDAN_FORMULA'].get('ENABLED', False)
-        visible_columns = config.get('VISIBLE_COLUMNS', [])
-
-        if use_jordan_formula:
-            select_mode = config['JORDAN_FORMULA'].get('SELECT_MODE', False)
-            select_teams = set(config.get('SELECTED', []) or [])
-        else:
-            select_mode, select_teams = False, []
-
-        to_log('Getting all team stats')
-        scrape_team_stats(raw_table_data, at_large_teams, ineligible_teams, select_mode, select_teams, team_dict_list)
-
-        if not visible_columns:
-            to_log('No VISIBLE_COLUMNS specified. Doing nothing, buh bye.')
-        elif use_jordan_formula:
-            to_log('\n\nSorting results and writing to file\n')
-            sorted_team_list = sort_teams(team_dict_list, config['JORDAN_FORMULA'], select_mode)
-            fname = generate_output_file(sorted_team_list, use_jordan_formula,
-                                 visible_columns, select_mode)
-        else:
-            to_log('\n\nWriting results to file\n')
-            fname = generate_output_file(team_dict_list, use_jordan_formula,
-                                 visible_columns, select_mode)
+        if current_job.get() is None:
+            logging.basicConfig(level=logging.INFO,
+                                filename=log_fname,
+                                filemode='w',
+                                format='%(message)s')
+        get_logger().setLevel(TRACE if config.get('LOG_COMPARISONS', False) else logging.INFO)
+        run_metrics = RunMetrics()
+        metrics_token = current_run_metrics.set(run_metrics)
+        try:
+            team_dict_list = []
+            ineligible_teams = set(config.get('INELIGIBLE', []) or [])
+            at_large_teams = set(config.get('AT_LARGE', []) or [])
+            max_workers = int(config.get('SCRAPE_WORKERS', 1) or 1)
+            scrape_engine = config.get('SCRAPE_ENGINE', 'threaded')
+            use_jordan_formula = 'JORDAN_FORMULA' in config and config['JORDAN_FORMULA'].get('ENABLED', False)
+            visible_columns = config.get('VISIBLE_COLUMNS', [])
+            output_format = str(config.get('OUTPUT_FORMAT', 'xlsx') or 'xlsx').lower()
+            check_output_format(output_format)
+            check_choice('SCRAPE_ENGINE', scrape_engine, SCRAPE_ENGINES)
+
+            if use_jordan_formula:
+                check_formula_modes(config['JORDAN_FORMULA'])
+                select_mode = config['JORDAN_FORMULA'].get('SELECT_MODE', False)
+                select_teams = set(config.get('SELECTED', []) or [])
+                # teams the formula would filter out are not fetched at all
+                fetch_filter = make_fetch_filter(config['JORDAN_FORMULA'])
+            else:
+                select_mode, select_teams, fetch_filter = False, [], None
+
+            # jobs running at the same time share the HTTP session, cache, store and fixtures
+            with shared_settings(config, max_workers):
+                snapshot_max_age_seconds = float(config.get('SNAPSHOT_MAX_AGE_MINUTES', 0) or 0) * 60
+                snapshot = get_scrape_snapshot(YEAR_INT, snapshot_max_age_seconds)
+                checkpoint = open_checkpoint(config.get('CHECKPOINT', {}) or {}, YEAR_INT, text, snapshot)
+                checkpoint_token = current_checkpoint.set(checkpoint)
+
+                scrape_start = time.perf_counter()
+                try:
+                    if scrape_engine == 'asyncio':
+                        to_log(f'Getting all team stats (asyncio, {max_workers} concurrent requests)')
+                        asyncio.run(scrape_team_stats_async(at_large_teams, ineligible_teams, select_mode,
+                                                            select_teams, team_dict_list, max_workers, snapshot,
+                                                            fetch_filter))
+                    else:
+                        net_nitty_rows = snapshot.get('net_nitty', get_net_nitty_raw_data)
+                        to_log(f'Getting all team stats ({max_workers} worker{"s" if max_workers > 1 else ""})')
+                        scrape_team_stats(net_nitty_rows, at_large_teams, ineligible_teams, select_mode, select_teams,
+                                          team_dict_list, max_workers, snapshot, fetch_filter)
+                except Exception:
+                    if checkpoint is not None:
+                        to_log(f'{len(checkpoint.written)} team sheets are saved in {checkpoint.path}. Retry the job '
+                               f'or upload the same config.txt to fetch only the rest.')
+                    raise
+                finally:
+                    current_checkpoint.reset(checkpoint_token)
+                observe('warrennolan_stage_seconds', time.perf_counter() - scrape_start, stage='scrape')
+
+                if snapshot.resumed_count:
+                    to_log(f'Resumed {snapshot.resumed_count} team sheets from the last attempt')
+
+                if snapshot_store is not None and not using_fixtures():
+                    to_log(f'Reused {snapshot.reused_count} unchanged team sheets from {snapshot_store.path}')
+                    snapshot_store.save(snapshot)
+
+            remember_scrape(team_dict_list, config.get('JORDAN_FORMULA', {}) or {}, select_mode, at_large_teams,
+                            snapshot.game_logs())
+
+            sweep_config = config.get('FORMULA_SWEEP', {}) or {}
+
+            if use_jordan_formula and sweep_config.get('ENABLED', False):
+                to_log('\n\nRunning formula sweep and writing to file\n')
+                with timer('warrennolan_stage_seconds', stage='sweep'):
+                    sweep_rows, variant_count = run_formula_sweep(team_dict_list, config['JORDAN_FORMULA'],
+                                                                  select_mode, sweep_config)
+                fname = generate_sweep_file(sweep_rows, variant_count, sweep_config.get('TOP_N', DEFAULT_SWEEP_TOP_N),
+                                            file_dir)
+            elif not visible_columns:
+                to_log('No VISIBLE_COLUMNS specified. Doing nothing, buh bye.')
+            elif use_jordan_formula:
+                to_log('\n\nSorting results and writing to file\n')
+                with timer('warrennolan_stage_seconds', stage='sort'):
+                    sorted_team_list = sort_teams(team_dict_list, config['JORDAN_FORMULA'], select_mode)
+                fname = generate_output_file(sorted_team_list, use_jordan_formula,
+                                     visible_columns, select_mode, file_dir, output_format)
+                keep_job_output(sorted_team_list, use_jordan_formula, visible_columns, select_mode, output_format)
+            else:
+                to_log('\n\nWriting results to file\n')
+                fname = generate_output_file(team_dict_list, use_jordan_formula,
+                                     visible_columns, select_mode, file_dir, output_format)
+                keep_job_output(team_dict_list, use_jordan_formula, visible_columns, select_mode, output_format)
+            if checkpoint is not None:
+                checkpoint.remove()
+        finally:
+            current_run_metrics.reset(metrics_token)
+            to_log(run_metrics.summary())
     else:
         to_log('The config.yaml file is missing. Doing nothing, buh bye.')
 
-    return fname, LOG_FNAME
+    return fname, log_fname
 
 
 app = Flask(__name__)
 
-OUTPUT_FILENAME = None
-LOG_FILENAME = None
-STATE = "state"
-IDLE = "idle"
+JOB_WORKERS = int(os.environ.get('WARRENNOLAN_JOB_WORKERS', 2))
+MAX_FINISHED_JOBS = 20
+# job logs past this size move from memory to a file in the system temp directory
+JOB_LOG_SPOOL_BYTES = 4 * 1024 * 1024
+QUEUED = "queued"
 PROCESSING = "processing"
 DOWNLOAD_READY = "dl_ready"
 DOWNLOAD_DONE = "dl_done"
 ERROR = "error"
-processing_status = {STATE: IDLE, ERROR: None}
-processing_lock = threading.Lock()
-
-def create_excel_file():
-    global processing_status
-    global OUTPUT_FILENAME
-    global LOG_FILENAME
-
-    with processing_lock:
-        processing_status[STATE] = PROCESSING
-        processing_status[ERROR] = None
-
-        try:
-            directory = Path(".")
-            for file in directory.glob("warren*xlsx"):
-                if file.is_file():
-                    file.unlink()
-
-            OUTPUT_FILENAME, LOG_FILENAME = do_the_work()
-
-        except Exception as e:
-            LOG_FILENAME = LOG_FNAME
-            processing_status[STATE] = ERROR
-            processing_status[ERROR] = str(e)
-            tb = traceback.format_exc()
-            to_log("FATAL ERROR:")
-            to_log(tb)
-        finally:
-            if processing_status[STATE] != ERROR:
-                processing_status[STATE] = DOWNLOAD_READY
-        log_queue.put("__done__")  # Signal completion
 
 
-def in_progress():
-    if processing_status[STATE] == ERROR:
+class Job:
+    """One uploaded config.txt with its status, log and output, none of them written to the working directory."""
+
+    def __init__(self, job_id, config_text):
+        self.id = job_id
+        self.config_text = config_text
+        self.state = QUEUED
+        self.error = None
+        # output_cache key of the output file
+        self.output_fname = None
+        self.output_format = 'xlsx'
+        # (team list, jordan_formula, visible_columns, select_mode) of the output, see keep_job_output
+        self.output_source = None
+        # output format -> output_cache key
+        self.output_keys = {}
+        self.output_lock = threading.Lock()
+        self.created_at = datetime.now(pytz.timezone('America/New_York'))
+        self.broadcaster = LogBroadcaster(LOG_BUFFER_LINES)
+        self.log_file = tempfile.SpooledTemporaryFile(max_size=JOB_LOG_SPOOL_BYTES, mode='w+', encoding='utf-8')
+
+        # not registered with logging.getLogger, so it goes away with the job
+        self.logger = logging.Logger(f'warrennolan.job.{job_id}', logging.INFO)
+        self.log_handler = None
+        self.open_log()
+
+    def open_log(self):
+        self.log_handler = logging.StreamHandler(self.log_file)
+        self.log_handler.setFormatter(logging.Formatter('%(message)s'))
+        self.logger.addHandler(self.log_handler)
+
+    def close_log(self):
+        if self.log_handler is not None:
+            self.logger.removeHandler(self.log_handler)
+            self.log_handler.close()
+            self.log_handler = None
+
+    def log_data(self):
+        """The job's log so far, as UTF-8 bytes."""
+        with self.output_lock:
+            self.log_file.seek(0)
+            text = self.log_file.read()
+            self.log_file.seek(0, io.SEEK_END)
+        return text.encode('utf-8')
+
+    def is_finished(self):
+        return self.state in [DOWNLOAD_READY, DOWNLOAD_DONE, ERROR]
+
+    def output_data(self, output_format=None):
+        """Returns (file name, bytes) of the output in output_format, writing it again if needed, or None."""
+        output_format = output_format or self.output_format
+        with self.output_lock:
+            key = self.output_keys.get(output_format)
+            if output_format == self.output_format and key is None:
+                key = self.output_fname
+            data = output_cache.get(key) if key else None
+            if data is None:
+                if self.output_source is None:
+                    return None
+                key = generate_output_file(*self.output_source, output_dir=None, output_format=output_format)
+                data = output_cache.get(key)
+            self.output_keys[output_format] = key
+            return output_name(key), data
+
+    def discard_output(self):
+        output_cache.discard(list(self.output_keys.values()) + ([self.output_fname] if self.output_fname else []))
+
+
+jobs = {}
+jobs_lock = threading.Lock()
+job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS)
+
+
+def create_job(config_text):
+    with jobs_lock:
+        finished_jobs = sorted([job for job in jobs.values() if job.is_finished()], key=lambda job: job.created_at)
+        for job in finished_jobs[:max(len(finished_jobs) - MAX_FINISHED_JOBS + 1, 0)]:
+            del jobs[job.id]
+            job.close_log()
+            job.log_file.close()
+            job.discard_output()
+        job = Job(uuid.uuid4().hex[:12], config_text)
+        jobs[job.id] = job
+    return job
+
+
+def run_job(job):
+    """Runs do_the_work for one job on a job_executor thread."""
+    token = current_job.set(job)
+    job.state = PROCESSING
+    try:
+        job.output_fname = do_the_work(in_memory_output=True, config_text=job.config_text)[0]
+        job.state = DOWNLOAD_READY
+        count('warrennolan_runs_total', result='ok')
+    except Exception as e:
+        count('warrennolan_runs_total', result='error')
+        job.state = ERROR
+        job.error = str(e)
+        tb = traceback.format_exc()
+        to_log("FATAL ERROR:")
+        to_log(tb)
+    finally:
+        job.broadcaster.publish("__done__")  # Signal completion
+        job.close_log()
+        current_job.reset(token)
+
+
+def retry_job(job):
+    """Runs a failed job again from its checkpoint. Returns False if the job has not failed."""
+    with jobs_lock:
+        if job.state != ERROR:
+            return False
+        job.state = QUEUED
+        job.error = None
+    # the log of the failed attempt stays above the new one
+    job.open_log()
+    job.broadcaster.start_run()
+    job_executor.submit(run_job, job)
+    return True
+
+
+def get_job(job_id):
+    with jobs_lock:
+        return jobs.get(job_id)
+
+
+def in_progress(job):
+    if job.state == ERROR:
         return '''
             <!doctype html>
             <html>
                 <body>
                    <h1>Error!!!!!!!!!!!!!!!!!!!!!!!!!</h1>
                    <p>{}</p>
-                   <a href="/reset">Reset</a>
+                   <form action="/jobs/{}/retry" method="post"><button>Retry</button></form>
+                   <p><a href="/jobs/{}/download_log">Download Log</a></p>
+                   <a href="/">Home</a>
                 </body>
             </html>
-        '''.format(processing_status[ERROR])
+        '''.format(html.escape(job.error or ''), job.id, job.id)
     else:
         return '''
             <!doctype html>
             <html>
                 <body>
                     <h1>File is being processed...</h1>
-                   <p>Check status: <a href="/status">Click here</a></p>
+                   <p>Check status: <a href="/jobs/{}/status">Click here</a></p>
                 </body>
             </html>
-        '''
+        '''.format(job.id)
 
 
 def upload_config():
+    with jobs_lock:
+        job_list = sorted(jobs.values(), key=lambda job: job.created_at, reverse=True)
+    job_rows = ''.join(
+        f'<li><a href="/jobs/{job.id}/status">{job.id}</a> '
+        f'{job.created_at.strftime("%Y-%m-%d %H:%M:%S")} {job.state}</li>'
+        for job in job_list)
     return '''
         <!doctype html>
         <html>
@@ -908,9 +3135,11 @@ def upload_config():
                         document.getElementById("uploadForm").submit();
                     });
                 </script>
+                <h2>Jobs</h2>
+                <ul>%s</ul>
             </body>
         </html>
-    '''
+    ''' % job_rows
 
 
 @app.route("/", methods=["GET", "POST", "HEAD"])
@@ -923,57 +3152,76 @@ def home_page():
             return "No selected file", 400
         elif file.filename != "config.txt":
             return "File must be named config.txt", 400
-        elif processing_status[STATE] == PROCESSING:
-            return 'Request in progress. Cannot start a new request until the last one is done. <a href="/">Click here</a>', 400
-        elif processing_status[STATE] == DOWNLOAD_READY:
-            return 'Last request is complete but excel file has not been downloaded. Cannot start new request until the excel file has been <a href="/download_excel">downloaded</a>.', 400
         else:
-            input_filepath = os.path.join(os.getcwd(), file.filename)
-            file.save(input_filepath)
+            try:
+                config_text = file.read().decode('utf-8')
+            except UnicodeDecodeError:
+                return "config.txt must be saved as UTF-8 text", 400
+            job = create_job(config_text)
 
-            # Start processing in a separate thread
-            thread = threading.Thread(target=create_excel_file)
-            thread.daemon = True
-            thread.start()
+            # Start processing on the job pool
+            job_executor.submit(run_job, job)
 
-            return in_progress()
+            return redirect(f'/jobs/{job.id}/status')
     elif request.method == "GET":
-        if processing_status[STATE] in [IDLE, DOWNLOAD_DONE]:
-            return upload_config()
-        else:
-            return in_progress()
+        return upload_config()
     elif request.method == "HEAD":
         return "", 200
 
 
-from flask import Response
-
-@app.route("/status_stream")
-def status_stream():
-    def generate():
-        while True:
-            line = log_queue.get()  # Wait for next line
-            if line == "__done__":
-                done_sent = True
-                break
-            yield f"data: {line}\n\n"  # SSE format
-
-        if done_sent:
-            yield "data: __done__\n\n"
-
-    return Response(generate(), mimetype="text/event-stream")
+@app.route("/jobs/<job_id>/status_stream")
+def status_stream(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return "No such job", 404
 
+    # A reconnecting EventSource sends the id of the last line it got
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    cursor = job.broadcaster.subscribe(int(last_event_id) if last_event_id.isdigit() else None)
 
-@app.route("/status")
-def check_status():
-    """Endpoint to check if the file is ready for download."""
-    if processing_status[STATE] == DOWNLOAD_READY:
-        return '''
+    def generate(cursor):
+        while True:
+            lines = job.broadcaster.read(cursor, timeout=15)
+            if lines is None:
+                yield "data: __dropped__\n\n"
+                return
+            if not lines:
+                yield ": keepalive\n\n"
+                continue
+            for seq, line in lines:
+                if line == "__done__":
+                    yield f"id: {seq}\ndata: __done__\n\n"
+                    return
+                yield f"id: {seq}\ndata: {line}\n\n"  # SSE format
+            cursor = lines[-1][0] + 1
+
+    return Response(generate(cursor), mimetype="text/event-stream")
+
+
+def other_formats(job):
+    """Download links for the formats the job's output can be converted to."""
+    if job.output_source is None:
+        return ''
+    links = ' | '.join(f'<a href="/jobs/{job.id}/download_excel?format={output_format}">{output_format}</a>'
+                       for output_format in available_output_formats())
+    return f'<p>Other formats: {links}</p>'
+
+
+@app.route("/jobs/<job_id>/status")
+def check_status(job_id):
+    """Endpoint to check if the job's file is ready for download."""
+    job = get_job(job_id)
+    if job is None:
+        return "No such job. Go <a href='/'>home</a>", 404
+
+    if job.state == DOWNLOAD_READY:
+        return f'''
         <h1>Processing complete!</h1>
-        <p><a href="/download_excel">Download Excel</a></p>
-        <p><a href="/download_log">Download Log</a></p>
+        <p><a href="/jobs/{job.id}/download_excel">Download Excel</a></p>
+        {other_formats(job)}
+        <p><a href="/jobs/{job.id}/download_log">Download Log</a></p>
         '''
-    elif processing_status[STATE] == PROCESSING:
+    elif job.state in [QUEUED, PROCESSING]:
         return '''
         <!doctype html>
         <html>
@@ -997,7 +3245,7 @@ def check_status():
     
                 <script>
                     var logOutput = document.getElementById("logOutput");
-                    var evtSource = new EventSource("/status_stream");
+                    var evtSource = new EventSource("/jobs/%s/status_stream");
     
                     evtSource.onmessage = function(e) {
                         if (e.data === "__done__") {
@@ -1006,6 +3254,13 @@ def check_status():
                             logOutput.scrollTop = logOutput.scrollHeight;
                             return;
                         }
+
+                        if (e.data === "__dropped__") {
+                            evtSource.close();
+                            logOutput.innerHTML += "\\n--- Fell too far behind the log. Reload page to reconnect. ---\\n";
+                            logOutput.scrollTop = logOutput.scrollHeight;
+                            return;
+                        }
     
                         if (e.data.trim() !== "") {
                             logOutput.innerHTML += e.data + "\\n";
@@ -1019,28 +3274,51 @@ def check_status():
                 </script>
             </body>
         </html>
+        ''' % job.id
+    elif job.state == DOWNLOAD_DONE:
+        return f'''
+            <h1>Processing...</h1><p>Processing complete and the output has been downloaded.
+            <a href="/jobs/{job.id}/download_excel">Download again</a> or go <a href="/">home</a></p>
         '''
-    elif processing_status[STATE] == DOWNLOAD_DONE:
-        return '''
-            <h1>Processing...</h1><p>Processing complete and the output has been downloaded. Go <a href="/">home</a></p>
-        '''
-
-@app.route("/download_excel")
-def download_excel_file():
-    """Download the processed Excel file."""
-    global OUTPUT_FILENAME
-
-    if processing_status[STATE] == PROCESSING:
+    else:
+        return in_progress(job)
+
+
+@app.route("/jobs/<job_id>/retry", methods=["POST"])
+def retry(job_id):
+    """Runs a failed job again, fetching only the team sheets the failed attempt did not get."""
+    job = get_job(job_id)
+    if job is None:
+        return "No such job", 404
+    if not retry_job(job):
+        return "Only a failed job can be retried", 409
+    return redirect(f'/jobs/{job.id}/status')
+
+
+@app.route("/jobs/<job_id>/download_excel")
+def download_excel_file(job_id):
+    """Download the job's output file. ?format=csv|jsonl|parquet|xlsx picks another format."""
+    job = get_job(job_id)
+    if job is None:
+        return "No such job", 404
+
+    output_format = request.args.get('format', '')
+    if output_format and output_format not in OUTPUT_FORMATS:
+        return f"format must be one of {', '.join(OUTPUT_FORMATS)}", 400
+    if not job.is_finished():
         return "File is not ready yet", 400
-    elif processing_status[STATE] == DOWNLOAD_DONE:
-        return "File was already downloaded. Check your Downloads folder.", 400
+    elif not job.output_fname:
+        return "This job did not produce a file. Check the log.", 400
+    elif output_format and output_format != job.output_format and job.output_source is None:
+        return "This job's output is only available as Excel", 400
     else:
-        processing_status[STATE] = DOWNLOAD_DONE
+        job.state = DOWNLOAD_DONE
+        format_query = f'?format={output_format}' if output_format else ''
         return f"""
         <!doctype html>
         <html>
             <body>
-                <a id="downloadLink" href="/get_excel" download></a>
+                <a id="downloadLink" href="/jobs/{job.id}/get_excel{format_query}" download></a>
                 <script>
                     document.getElementById("downloadLink").click();
                     setTimeout(function() {{
@@ -1052,30 +3330,75 @@ def download_excel_file():
         """
 
 
-@app.route("/get_excel")
-def get_excel():
-    """Serve the file for download."""
-    global OUTPUT_FILENAME
-    return send_file(OUTPUT_FILENAME, as_attachment=True)
-
-
-@app.route("/download_log")
-def download_log_file():
-    global LOG_FILENAME
-
-    if processing_status[STATE] in [PROCESSING, IDLE]:
+@app.route("/jobs/<job_id>/get_excel")
+def get_excel(job_id):
+    """Serve the file for download, in the ?format= format if one is given."""
+    job = get_job(job_id)
+    if job is None or not job.output_fname:
+        return "No such file", 404
+    output_format = request.args.get('format', '')
+    if output_format and output_format not in OUTPUT_FORMATS:
+        return f"format must be one of {', '.join(OUTPUT_FORMATS)}", 400
+    try:
+        output = job.output_data(output_format)
+    except (RuntimeError, ValueError) as e:
+        return str(e), 400
+    if output is None:
+        if output_format and output_format != job.output_format:
+            return "This job's output is only available as Excel", 400
+        return "The file has expired. Upload the config.txt again.", 410
+    name, data = output
+    return send_file(io.BytesIO(data), as_attachment=True, download_name=name)
+
+
+@app.route("/jobs/<job_id>/download_log")
+def download_log_file(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return "No such job", 404
+
+    if not job.is_finished():
         return "File is not ready yet", 400
     else:
-        return send_file(LOG_FILENAME, as_attachment=True)
+        return send_file(io.BytesIO(job.log_data()), as_attachment=True, download_name=LOG_FNAME)
+
 
+@app.route("/metrics")
+def metrics():
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
 
-@app.route("/reset")
-def reset():
-    global processing_status, OUTPUT_FILENAME, LOG_FILENAME
-    processing_status = {STATE: IDLE, ERROR: None}
-    OUTPUT_FILENAME = None
-    LOG_FILENAME = None
-    return "Reset complete. <a href='/'>Home</a>"
+
+@app.route("/what_if", methods=["POST"])
+def what_if():
+    """
+    Re-sorts the last run's teams with the JORDAN_FORMULA keys in the body, or with
+    {"JORDAN_FORMULA": {...}, "AT_LARGE": [...]}. Nothing is fetched.
+    """
+    body = request.get_json(silent=True)
+    at_large_teams = None
+    if isinstance(body, dict) and ('JORDAN_FORMULA' in body or 'AT_LARGE' in body):
+        at_large_teams = body.get('AT_LARGE')
+        body = body.get('JORDAN_FORMULA', {})
+        if at_large_teams is not None and not isinstance(at_large_teams, list):
+            return "AT_LARGE must be a list of team names", 400
+    if not isinstance(body, dict):
+        return "Body must be a JSON object of JORDAN_FORMULA settings", 400
+    invalid_keys = invalid_formula_values(body)
+    if invalid_keys:
+        return "These JORDAN_FORMULA settings must be numbers: " + ", ".join(invalid_keys), 400
+    try:
+        check_formula_modes(body)
+    except ValueError as e:
+        return str(e), 400
+    if last_scrape is not None and not last_scrape['formula'].get('ENABLED', False):
+        return "The last run did not use JORDAN_FORMULA. Upload a config.txt with it enabled first.", 409
+
+    start = time.perf_counter()
+    result = what_if_ranking(body, at_large_teams)
+    if result is None:
+        return "No scraped data yet. Upload a config.txt first.", 409
+    result['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    return jsonify(result)
 
 
 if __name__ == "__main__":
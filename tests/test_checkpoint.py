@@ -0,0 +1,149 @@
+"""Checkpoint files and retrying a failed job from one."""
+import os
+
+import pytest
+
+import main
+
+CONFIG_TEXT = 'SCRAPE_WORKERS: 1\n'
+SHEET = main.TeamSheet('https://www.warrennolan.com/basketball/team-net-sheet?team=Duke', '1', '2', '3', '4', '5',
+                       '6', [main.GameResult('H', 'UNC', '80', '70', 'Q1')])
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(main.time, 'time', clock)
+    return clock
+
+
+def net_row(team, overall_record='20-3'):
+    return main.NetNittyRow(
+        net='1', team=team, conf='ACC', conf_record='10-2', overall_record=overall_record, sos='5', nc_record='9-1',
+        nc_sos='20', home_record='12-0', road_record='5-2', neutral_record='3-1', q1_record='6-2', q2_record='5-1',
+        q3_record='4-0', q4_record='5-0', avg_net_wins='80', avg_net_losses='30', conf_leader=True, ineligible=False)
+
+
+def open_checkpoint(tmp_path, config_text=CONFIG_TEXT, max_age_hours=12):
+    snapshot = main.ScrapeSnapshot(2026)
+    checkpoint_config = {'ENABLED': True, 'DIRECTORY': str(tmp_path), 'MAX_AGE_HOURS': max_age_hours}
+    return main.open_checkpoint(checkpoint_config, 2026, config_text, snapshot), snapshot
+
+
+@pytest.fixture(autouse=True)
+def no_fixtures(monkeypatch):
+    monkeypatch.setattr(main, 'fixture_store', None)
+
+
+def test_sheets_are_read_back_and_written_once(tmp_path, clock):
+    checkpoint = main.Checkpoint(tmp_path, 2026, 'a' * 64)
+    checkpoint.add(net_row('Duke'), SHEET, clock.now)
+    checkpoint.add(net_row('Duke'), SHEET, clock.now)
+    # the half-written last line of a run that died
+    with open(checkpoint.path, 'a', encoding='utf-8') as f:
+        f.write('{"team": "UNC", "row_')
+
+    stored = main.Checkpoint(tmp_path, 2026, 'a' * 64).load(3600)
+    assert stored == {'Duke': main.StoredTeamSheet(main.net_row_key(net_row('Duke')), clock.now, SHEET)}
+    assert sum(1 for _ in open(checkpoint.path, encoding='utf-8')) == 2
+
+
+def test_same_config_resumes_the_snapshot(tmp_path, clock):
+    checkpoint, _ = open_checkpoint(tmp_path)
+    checkpoint.add(net_row('Duke'), SHEET, clock.now)
+
+    _, snapshot = open_checkpoint(tmp_path)
+    snapshot.get('net_nitty', lambda: [net_row('Duke')])
+    assert snapshot.get(('team', 'Duke'), pytest.fail) == SHEET
+    assert snapshot.resumed_count == 1
+    # another config.txt starts from nothing
+    _, snapshot = open_checkpoint(tmp_path, config_text=CONFIG_TEXT + 'AT_LARGE: []\n')
+    assert snapshot.resumed == {}
+
+
+def test_checkpoint_past_max_age_is_deleted(tmp_path, clock):
+    checkpoint, _ = open_checkpoint(tmp_path)
+    checkpoint.add(net_row('Duke'), SHEET, clock.now)
+    os.utime(checkpoint.path, (clock.now, clock.now))
+    clock.now += 12 * 3600
+    _, snapshot = open_checkpoint(tmp_path, max_age_hours=12)
+    assert not checkpoint.path.exists()
+    assert snapshot.resumed == {}
+
+
+def test_sheets_past_max_age_are_not_resumed(tmp_path, clock):
+    checkpoint, _ = open_checkpoint(tmp_path)
+    checkpoint.add(net_row('Duke'), SHEET, clock.now - 13 * 3600)
+    _, snapshot = open_checkpoint(tmp_path, max_age_hours=12)
+    assert snapshot.resumed == {}
+
+
+class ImmediateExecutor:
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+class FlakyScrape:
+    """Stands in for scrape_team_stats: saves Duke's sheet, then fails the first time and gets UNC the second."""
+
+    def __init__(self):
+        self.runs = 0
+        self.fetched = []
+
+    def __call__(self, net_nitty_rows, at_large_teams, ineligible_teams, select_mode, select_teams, team_dict_list,
+                 max_workers=1, snapshot=None, fetch_filter=None):
+        self.runs += 1
+        for row in net_nitty_rows:
+            if self.runs == 1 and row.team == 'UNC':
+                raise ConnectionError('UNC timed out')
+            sheet = snapshot.get(('team', row.team), lambda: self.fetch(row.team))
+            main.checkpoint_team_sheet(row, sheet, snapshot)
+
+    def fetch(self, team):
+        self.fetched.append(team)
+        return SHEET._replace(team_url=team)
+
+
+@pytest.fixture
+def job_runner(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'jobs', {})
+    monkeypatch.setattr(main, 'scrape_snapshots', {})
+    monkeypatch.setattr(main, 'job_executor', ImmediateExecutor())
+    monkeypatch.setattr(main, 'get_net_nitty_raw_data', lambda: [net_row('Duke'), net_row('UNC')])
+    scrape = FlakyScrape()
+    monkeypatch.setattr(main, 'scrape_team_stats', scrape)
+    config_text = f'CHECKPOINT:\n  ENABLED: true\n  DIRECTORY: {tmp_path.as_posix()}\nVISIBLE_COLUMNS: []\n'
+    job = main.create_job(config_text)
+    main.run_job(job)
+    return job, scrape
+
+
+def test_retry_fetches_only_what_the_failed_attempt_did_not(job_runner, tmp_path):
+    job, scrape = job_runner
+    assert job.state == main.ERROR
+    assert scrape.fetched == ['Duke']
+    assert len(list(tmp_path.glob('*.jsonl'))) == 1
+
+    response = main.app.test_client().post(f'/jobs/{job.id}/retry')
+    assert response.status_code == 302
+    assert job.state == main.DOWNLOAD_READY
+    assert scrape.fetched == ['Duke', 'UNC']
+    assert 'Resumed 1 team sheets from the last attempt' in job.log_data().decode('utf-8')
+    # the run finished, so the checkpoint is gone
+    assert list(tmp_path.glob('*.jsonl')) == []
+
+
+def test_only_failed_jobs_can_be_retried(job_runner):
+    job, _ = job_runner
+    client = main.app.test_client()
+    assert client.post('/jobs/nope/retry').status_code == 404
+    client.post(f'/jobs/{job.id}/retry')
+    assert client.post(f'/jobs/{job.id}/retry').status_code == 409
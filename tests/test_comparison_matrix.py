@@ -0,0 +1,52 @@
+"""comparison_matrix must agree with compare_teams on every pair of teams."""
+import itertools
+import random
+
+import pytest
+
+import main
+
+FORMULA_PTS_KEYS = [
+    'SOR_PTS', 'ROAD_AND_NEUTRAL_PTS', 'HIGH_Q1_PTS', 'Q1_PTS', 'Q1_AND_Q2_PTS', 'Q3_AND_Q4_PTS', 'Q4_PTS',
+    'WAALT_PTS', 'KPI_PTS', 'BPI_PTS', 'POM_PTS', 'HIGH_Q1_RN_PTS', 'NC_SOS_PTS', 'CONF_LEADER_PTS',
+    'BAD_NC_SOS_DEDUCT_PTS', 'WAB_PTS', 'T-RANK_PTS', 'BPI_SELECT_PTS', 'POM_SELECT_PTS', 'T-RANK_SELECT_PTS'
+]
+
+
+def record(rng):
+    return '%i-%i' % (rng.randint(0, 20), rng.randint(0, 12))
+
+
+def random_team(rng, net):
+    return main.TeamRecord(
+        team='Team %i' % net, team_url='', net=net, conf='Conf %i' % (net % 9), conf_record=record(rng),
+        overall_record=record(rng), kpi=rng.randint(1, 360), sor=rng.randint(1, 360), wab=rng.randint(1, 360),
+        bpi=rng.randint(1, 360), pom=rng.randint(1, 360), t_rank=rng.randint(1, 360), nc_record=record(rng),
+        nc_sos=rng.randint(1, 360), home_record=record(rng), road_record=record(rng), neutral_record=record(rng),
+        q1_record=record(rng), q2_record=record(rng), q3_record=record(rng), q4_record=record(rng),
+        high_q1_wins=rng.randint(0, 5), high_q1_losses=rng.randint(0, 5), high_q1_rn_wins=rng.randint(0, 5),
+        high_q1_rn_losses=rng.randint(0, 5), al_wins=rng.randint(0, 5), al_losses=rng.randint(0, 5),
+        avg_net_wins=str(rng.randint(1, 360)), avg_net_losses=str(rng.randint(1, 360)),
+        conf_leader=rng.random() < .2
+    )
+
+
+def random_formula(rng):
+    formula = {key: rng.choice([0, 0.5, 1, 1.3, 2, 5, 12]) for key in FORMULA_PTS_KEYS}
+    formula['NEW_RECORD_COMPARISON'] = rng.random() < .5
+    formula['BAD_NC_SOS_DEDUCT_THRESHOLD'] = rng.choice([100, 200, 300])
+    return formula
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_comparison_matrix_matches_compare_teams(seed):
+    rng = random.Random(seed)
+    teams = [random_team(rng, net) for net in range(1, 41)]
+    # Equal metrics between teams exercise the tie handling
+    teams[1] = teams[1].replace(sor=teams[0].sor, kpi=teams[0].kpi, q1_record=teams[0].q1_record)
+    formula = random_formula(rng)
+    select_mode = rng.random() < .5
+
+    matrix = main.comparison_matrix(main.build_team_features(teams), formula, select_mode)
+    for i, j in itertools.product(range(len(teams)), repeat=2):
+        assert matrix[i, j] == main.compare_teams(teams[i], teams[j], formula, select_mode), (i, j)
@@ -0,0 +1,60 @@
+"""LogBroadcaster ring buffer and the SSE status stream built on it."""
+from types import SimpleNamespace
+
+import main
+
+
+def publish(broadcaster, *lines):
+    for line in lines:
+        broadcaster.publish(line)
+
+
+def test_subscriber_reads_every_line_in_order():
+    broadcaster = main.LogBroadcaster(4)
+    cursor = broadcaster.subscribe()
+    publish(broadcaster, 'a', 'b', 'c')
+    assert broadcaster.read(cursor, timeout=0) == [(0, 'a'), (1, 'b'), (2, 'c')]
+    assert broadcaster.read(3, timeout=0) == []
+
+
+def test_overwritten_cursor_reads_none():
+    broadcaster = main.LogBroadcaster(3)
+    cursor = broadcaster.subscribe()
+    publish(broadcaster, 'a', 'b', 'c', 'd')
+    assert broadcaster.read(cursor, timeout=0) is None
+    assert broadcaster.read(1, timeout=0) == [(1, 'b'), (2, 'c'), (3, 'd')]
+
+
+def test_new_subscriber_replays_the_current_run_only():
+    broadcaster = main.LogBroadcaster(10)
+    publish(broadcaster, 'old run')
+    broadcaster.start_run()
+    publish(broadcaster, 'a', 'b')
+    assert broadcaster.read(broadcaster.subscribe(), timeout=0) == [(1, 'a'), (2, 'b')]
+
+
+def test_resume_after_last_seen_line():
+    broadcaster = main.LogBroadcaster(10)
+    publish(broadcaster, 'a', 'b', 'c')
+    assert broadcaster.read(broadcaster.subscribe(last_seen_seq=1), timeout=0) == [(2, 'c')]
+    # an id from the future waits for the next line instead of skipping ahead
+    assert broadcaster.subscribe(last_seen_seq=99) == 3
+
+
+def status_stream(monkeypatch, broadcaster, headers=None):
+    monkeypatch.setattr(main, 'jobs', {'job': SimpleNamespace(broadcaster=broadcaster)})
+    response = main.app.test_client().get('/jobs/job/status_stream', headers=headers or {})
+    return response.get_data(as_text=True)
+
+
+def test_status_stream_resumes_from_last_event_id(monkeypatch):
+    broadcaster = main.LogBroadcaster(10)
+    publish(broadcaster, 'a', 'b', 'c', '__done__')
+    assert status_stream(monkeypatch, broadcaster, {'Last-Event-ID': '1'}) == (
+        'id: 2\ndata: c\n\nid: 3\ndata: __done__\n\n')
+
+
+def test_status_stream_reports_dropped_lines(monkeypatch):
+    broadcaster = main.LogBroadcaster(2)
+    publish(broadcaster, 'a', 'b', 'c', '__done__')
+    assert status_stream(monkeypatch, broadcaster, {'Last-Event-ID': '0'}) == 'data: __dropped__\n\n'
@@ -0,0 +1,197 @@
+"""TokenBucket, AdaptiveConcurrency and the retry loops, with a fake clock and a fake transport."""
+import asyncio
+
+import pytest
+import requests
+
+import main
+
+URL = 'https://www.warrennolan.com/basketball/net-nitty'
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakePage:
+    def __init__(self, status_code, headers=None, content=b'page'):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = content
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    """Answers get() from a list of pages; an exception in the list is raised instead."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def get(self, url, headers=None, stream=False, timeout=None):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    """Routes http_get to a FakeSession and records the time.sleep calls instead of sleeping."""
+    sleeps = []
+    monkeypatch.setattr(main.time, 'sleep', sleeps.append)
+    monkeypatch.setattr(main, 'fixture_store', None)
+    monkeypatch.setattr(main, 'http_rate_limit', None)
+    monkeypatch.setattr(main, 'http_concurrency', main.AdaptiveConcurrency(4))
+    monkeypatch.setattr(main, 'http_retries', 3)
+    monkeypatch.setattr(main, 'http_backoff_seconds', 1.0)
+    monkeypatch.setattr(main, 'http_max_backoff_seconds', 60.0)
+
+    def use(*responses):
+        session = FakeSession(*responses)
+        monkeypatch.setattr(main, 'get_http_session', lambda: session)
+        return session
+
+    use.sleeps = sleeps
+    return use
+
+
+def test_token_bucket_allows_bursts_then_the_rate(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(main.time, 'monotonic', clock)
+    bucket = main.TokenBucket(rate=2, burst=2)
+    assert bucket.try_acquire() and bucket.try_acquire()
+    assert not bucket.try_acquire()
+    clock.now += 0.5
+    assert bucket.try_acquire()
+    # reserve borrows ahead and says how long to wait for each token
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+    clock.now += 10
+    assert bucket.reserve() == 0.0
+
+
+def test_failures_halve_the_limit_down_to_one():
+    concurrency = main.AdaptiveConcurrency(8)
+    limits = []
+    for _ in range(5):
+        concurrency.acquire()
+        concurrency.release(0.1, ok=False)
+        limits.append(concurrency.limit)
+    assert limits == [4, 2, 1, 1, 1]
+    assert concurrency.in_flight == 0
+
+
+def test_fast_successes_grow_the_limit_back_to_the_maximum():
+    concurrency = main.AdaptiveConcurrency(4)
+    concurrency.limit = 1.0
+    concurrency.acquire()
+    concurrency.release(0.1, ok=True)
+    assert concurrency.limit == 2.0
+    for _ in range(20):
+        concurrency.acquire()
+        concurrency.release(0.1, ok=True)
+    assert concurrency.limit == 4
+
+
+def test_slow_responses_shrink_the_limit_a_step():
+    concurrency = main.AdaptiveConcurrency(4)
+    concurrency.acquire()
+    concurrency.release(0.1, ok=True)
+    concurrency.acquire()
+    concurrency.release(main.SLOW_LATENCY_SECONDS + 0.5, ok=True)
+    assert concurrency.limit == pytest.approx(4 - 1 / 4)
+
+
+def test_retry_after_is_waited_for(transport):
+    session = transport(FakePage(429, {'Retry-After': '7'}), FakePage(200))
+    assert main.http_get(URL).status_code == 200
+    assert session.calls == 2
+    assert transport.sleeps == [7.0]
+
+
+def test_retry_after_is_capped_at_max_backoff(transport, monkeypatch):
+    monkeypatch.setattr(main, 'http_max_backoff_seconds', 5.0)
+    transport(FakePage(503, {'Retry-After': '3600'}), FakePage(200))
+    main.http_get(URL)
+    assert transport.sleeps == [5.0]
+
+
+def test_backoff_doubles_with_jitter(transport):
+    transport(requests.Timeout(), requests.ConnectionError(), FakePage(502), FakePage(200))
+    assert main.http_get(URL).status_code == 200
+    for attempt, delay in enumerate(transport.sleeps, start=1):
+        assert 2 ** (attempt - 1) / 2 <= delay <= 2 ** (attempt - 1)
+    assert len(transport.sleeps) == 3
+
+
+def test_error_is_raised_once_the_retries_are_used_up(transport):
+    session = transport(*[FakePage(503) for _ in range(4)])
+    with pytest.raises(requests.HTTPError):
+        main.http_get(URL)
+    assert session.calls == 4
+    assert main.http_concurrency.in_flight == 0
+
+
+class BlockingAsyncSession:
+    """aiohttp stand-in whose requests never answer."""
+
+    def __init__(self):
+        self.started = asyncio.Event()
+
+    def get(self, url, headers=None):
+        return self
+
+    async def __aenter__(self):
+        self.started.set()
+        await asyncio.Event().wait()
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+def test_cancelled_async_request_releases_its_slot(monkeypatch):
+    monkeypatch.setattr(main, 'fixture_store', None)
+    monkeypatch.setattr(main, 'http_rate_limit', None)
+    concurrency = main.AdaptiveConcurrency(1)
+    monkeypatch.setattr(main, 'http_concurrency', concurrency)
+
+    async def cancel_request():
+        session = BlockingAsyncSession()
+        request = asyncio.ensure_future(main.async_http_get(session, URL))
+        await session.started.wait()
+        assert concurrency.in_flight == 1
+        # a second request waits for the only slot
+        waiting = asyncio.ensure_future(concurrency.acquire_async())
+        await asyncio.sleep(0)
+        request.cancel()
+        await asyncio.gather(request, return_exceptions=True)
+        await asyncio.wait_for(waiting, 1)
+
+    asyncio.run(cancel_request())
+    assert concurrency.in_flight == 1
+    assert concurrency.async_waiters == []
+
+
+def test_cancelled_waiter_does_not_take_a_slot():
+    concurrency = main.AdaptiveConcurrency(1)
+
+    async def cancel_waiter():
+        await concurrency.acquire_async()
+        waiter = asyncio.ensure_future(concurrency.acquire_async())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        concurrency.release(0.1, ok=True)
+        await asyncio.wait_for(concurrency.acquire_async(), 1)
+
+    asyncio.run(cancel_waiter())
+    assert concurrency.in_flight == 1
+    assert concurrency.async_waiters == []
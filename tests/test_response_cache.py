@@ -0,0 +1,103 @@
+"""ResponseCache and cached_http_get against a fake transport."""
+import pytest
+
+import main
+
+URL = 'https://www.warrennolan.com/basketball/team-net-sheet?team=Duke'
+
+
+class FakePage:
+    def __init__(self, status_code, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+
+class FakeTransport:
+    """Stands in for http_get: answers from a list of pages and records the request headers."""
+
+    def __init__(self, *pages):
+        self.pages = list(pages)
+        self.requests = []
+
+    def __call__(self, url, headers=None, stream=False):
+        self.requests.append((url, dict(headers or {})))
+        return self.pages.pop(0)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(main.time, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch, clock):
+    cache = main.ResponseCache(tmp_path, ttl_seconds=60, max_bytes=1024)
+    monkeypatch.setattr(main, 'response_cache', cache)
+    monkeypatch.setattr(main, 'fixture_store', None)
+    return cache
+
+
+def use_transport(monkeypatch, *pages):
+    transport = FakeTransport(*pages)
+    monkeypatch.setattr(main, 'http_get', transport)
+    return transport
+
+
+def test_fresh_entry_is_served_without_a_request(cache, monkeypatch, clock):
+    transport = use_transport(monkeypatch, FakePage(200, b'sheet'))
+    assert main.cached_http_get(URL) == b'sheet'
+    clock.now += 59
+    assert main.cached_http_get(URL) == b'sheet'
+    assert len(transport.requests) == 1
+
+
+def test_stale_entry_sends_etag_and_last_modified(cache, monkeypatch, clock):
+    headers = {'ETag': '"v1"', 'Last-Modified': 'Sat, 17 Oct 2026 10:00:00 GMT'}
+    transport = use_transport(monkeypatch, FakePage(200, b'old', headers), FakePage(200, b'new'))
+    main.cached_http_get(URL)
+    clock.now += 61
+    assert main.cached_http_get(URL) == b'new'
+    assert transport.requests[0][1] == {}
+    assert transport.requests[1][1] == {'If-None-Match': '"v1"',
+                                        'If-Modified-Since': 'Sat, 17 Oct 2026 10:00:00 GMT'}
+    assert cache.read(URL) == b'new'
+
+
+def test_not_modified_reuses_the_stored_body(cache, monkeypatch, clock):
+    transport = use_transport(monkeypatch, FakePage(200, b'sheet', {'ETag': '"v1"'}), FakePage(304))
+    main.cached_http_get(URL)
+    clock.now += 61
+    assert main.cached_http_get(URL) == b'sheet'
+    assert len(transport.requests) == 2
+    # the 304 made the entry fresh again
+    clock.now += 59
+    assert main.cached_http_get(URL) == b'sheet'
+    assert len(transport.requests) == 2
+
+
+def test_least_recently_used_entries_are_evicted_past_max_bytes(tmp_path, clock):
+    cache = main.ResponseCache(tmp_path, ttl_seconds=60, max_bytes=25)
+    for name in ('a', 'b'):
+        cache.store(URL + name, b'x' * 10, {})
+        clock.now += 1
+    cache.read(URL + 'a')
+    clock.now += 1
+    cache.store(URL + 'c', b'x' * 10, {})
+
+    assert cache.get(URL + 'b') is None
+    assert cache.read(URL + 'b') is None
+    assert cache.read(URL + 'a') == b'x' * 10
+    assert cache.read(URL + 'c') == b'x' * 10
+    # a new ResponseCache on the same directory sees what is left
+    assert sorted(main.ResponseCache(tmp_path, 60, 25).index) == sorted(cache.index)
@@ -0,0 +1,150 @@
+"""ScrapeSnapshot single flight, shared by the threaded and asyncio engines."""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import main
+
+KEY = ('team', 'Duke')
+
+
+class StubFetcher:
+    """Counts its calls and, when gate is given, blocks each call until the gate opens."""
+
+    def __init__(self, result='sheet', gate=None, fail_times=0):
+        self.result = result
+        self.gate = gate
+        self.fail_times = fail_times
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            self.calls += 1
+            calls = self.calls
+        if self.gate is not None:
+            assert self.gate.wait(5)
+        if calls <= self.fail_times:
+            raise ConnectionError('fetch %i failed' % calls)
+        return self.result
+
+    async def fetch_async(self):
+        return self()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(main.time, 'time', clock)
+    return clock
+
+
+def wait_for_claim(snapshot, key):
+    while key not in snapshot.futures:
+        threading.Event().wait(0.001)
+
+
+def test_concurrent_threads_share_one_fetch():
+    snapshot = main.ScrapeSnapshot(2026)
+    gate = threading.Event()
+    fetch = StubFetcher(gate=gate)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [executor.submit(snapshot.get, KEY, fetch) for _ in range(8)]
+        wait_for_claim(snapshot, KEY)
+        gate.set()
+        assert [future.result() for future in futures] == ['sheet'] * 8
+    assert fetch.calls == 1
+    assert snapshot.get(KEY, fetch) == 'sheet'
+    assert fetch.calls == 1
+
+
+def test_asyncio_caller_waits_for_the_threaded_fetch():
+    snapshot = main.ScrapeSnapshot(2026)
+    gate = threading.Event()
+    fetch = StubFetcher(gate=gate)
+
+    async def fetch_both():
+        thread_result = asyncio.get_running_loop().run_in_executor(None, snapshot.get, KEY, fetch)
+        await asyncio.get_running_loop().run_in_executor(None, wait_for_claim, snapshot, KEY)
+        async_results = asyncio.gather(*(snapshot.get_async(KEY, fetch.fetch_async) for _ in range(4)))
+        gate.set()
+        return await thread_result, await async_results
+
+    assert asyncio.run(fetch_both()) == ('sheet', ['sheet'] * 4)
+    assert fetch.calls == 1
+
+
+def test_failed_fetch_is_forgotten_and_retried():
+    snapshot = main.ScrapeSnapshot(2026)
+    gate = threading.Event()
+    fetch = StubFetcher(gate=gate, fail_times=1)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(snapshot.get, KEY, fetch) for _ in range(4)]
+        wait_for_claim(snapshot, KEY)
+        gate.set()
+        # everyone waiting on the failed fetch sees its error
+        for future in futures:
+            with pytest.raises(ConnectionError):
+                future.result()
+    assert snapshot.results() == {}
+    assert snapshot.get(KEY, fetch) == 'sheet'
+    assert fetch.calls == 2
+
+
+def test_async_failed_fetch_is_retried():
+    snapshot = main.ScrapeSnapshot(2026)
+    fetch = StubFetcher(fail_times=1)
+
+    async def fetch_twice():
+        with pytest.raises(ConnectionError):
+            await snapshot.get_async(KEY, fetch.fetch_async)
+        return await snapshot.get_async(KEY, fetch.fetch_async)
+
+    assert asyncio.run(fetch_twice()) == 'sheet'
+    assert fetch.calls == 2
+
+
+def test_snapshot_is_shared_until_max_age(monkeypatch, clock):
+    monkeypatch.setattr(main, 'scrape_snapshots', {})
+    monkeypatch.setattr(main, 'snapshot_store', None)
+    monkeypatch.setattr(main, 'fixture_store', None)
+    snapshot = main.get_scrape_snapshot(2026, 300)
+    clock.now += 299
+    assert main.get_scrape_snapshot(2026, 300) is snapshot
+    clock.now += 1
+    assert main.get_scrape_snapshot(2026, 300) is not snapshot
+
+
+def net_row(team, overall_record):
+    return main.NetNittyRow(
+        net='1', team=team, conf='ACC', conf_record='10-2', overall_record=overall_record, sos='5', nc_record='9-1',
+        nc_sos='20', home_record='12-0', road_record='5-2', neutral_record='3-1', q1_record='6-2', q2_record='5-1',
+        q3_record='4-0', q4_record='5-0', avg_net_wins='80', avg_net_losses='30', conf_leader=True, ineligible=False)
+
+
+def test_saved_sheet_is_reused_while_the_net_row_is_unchanged(clock):
+    saved_row = net_row('Duke', '20-3')
+    previous = {'Duke': main.StoredTeamSheet(main.net_row_key(saved_row), clock.now - 60, 'saved sheet')}
+
+    def snapshot_with_row(row, max_reuse_age_seconds=3600):
+        snapshot = main.ScrapeSnapshot(2026, previous, max_reuse_age_seconds)
+        snapshot.get('net_nitty', lambda: [row])
+        return snapshot
+
+    fetch = StubFetcher()
+    assert snapshot_with_row(saved_row).get(KEY, fetch) == 'saved sheet'
+    assert fetch.calls == 0
+    # a game played since, or a saved sheet past max_reuse_age_seconds, means fetching again
+    assert snapshot_with_row(net_row('Duke', '21-3')).get(KEY, fetch) == 'sheet'
+    assert snapshot_with_row(saved_row, max_reuse_age_seconds=60).get(KEY, fetch) == 'sheet'
+    assert fetch.calls == 2
@@ -0,0 +1,44 @@
+"""team_sheet_text must give the same text as BeautifulSoup from the KPI: anchor on."""
+import pytest
+from bs4 import BeautifulSoup
+
+import main
+
+TEAM_SHEET = '''<!DOCTYPE html>
+<html>
+<head>
+<title>Team Sheet</title>
+<style>p {}</style>
+<script>var x = "<b>KPI:</b>";</script>
+</head>
+<body>
+<div class="header">Header</div>
+<div>KPI:</div>
+<div>a</div><div>b</div><div>c</div><div>d</div>
+<div>12</div><div>34</div><div></div>
+<table>
+  <tr>
+    <td>H: 1-15 | more</td>
+    <td> 17 </td>
+  </tr>
+  <tr><td>St. Mary's &amp; co &eacute; &#233; &nbsp;</td>  <td>N</td></tr>
+</table>
+ <!-- comment -->
+ <pre>  
+ </pre> <p>p1<br>p2</p><?php x ?>
+<div>Quadrant 2</div>
+<div>Non-Division I Games</div>
+</body>
+</html>
+'''
+
+
+@pytest.mark.parametrize('content', [
+    TEAM_SHEET.encode('utf-8'),
+    '<html><body><p>caf\xe9 KPI:\n 1</p>\n \n<template>x</template></body></html>'.encode('cp1252'),
+])
+def test_team_sheet_text_matches_beautifulsoup(content):
+    expected = BeautifulSoup(content, 'html.parser').text
+    text = main.team_sheet_text(content)
+    assert 'KPI:' in text
+    assert text[text.find('KPI:'):] == expected[expected.find('KPI:'):]